@@ -1,41 +1,116 @@
-import cv2
-import numpy as np
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import threading
 import time
 import os
 import json
-from plyer import notification
 import platform
 import subprocess
-import winsound
-from pystray import Icon, MenuItem as item
-from PIL import Image, ImageDraw
 import sys
 import webbrowser
+import argparse
+import collections
+import logging
+import logging.handlers
+import queue
+import atexit
+import shutil
+import multiprocessing
+from multiprocessing import shared_memory
+import concurrent.futures
+import uuid
+import csv
+import importlib
+import statistics
+import sqlite3
+import random
+import urllib.request
+import urllib.error
+import base64
+import hashlib
+import hmac
+
+
+# -------------------- Lazy Imports --------------------
+class LazyModule:
+    """Stands in for a module (or one of its attributes) and imports it on first use."""
+
+    def __init__(self, name, attr=None):
+        self._name = name
+        self._attr = attr
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            module = importlib.import_module(self._name)
+            self._target = getattr(module, self._attr) if self._attr else module
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+# Heavy and platform-specific modules load when first needed, so a --hidden
+# start reaches its first presence decision without waiting for all of them
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+notification = LazyModule("plyer", "notification")
+winsound = LazyModule("winsound")
+Icon = LazyModule("pystray", "Icon")
+item = LazyModule("pystray", "MenuItem")
+Image = LazyModule("PIL.Image")
+ImageDraw = LazyModule("PIL.ImageDraw")
 
 
 # -------------------- Lock Screen --------------------
-def lock_screen():
-    try:
-        system = platform.system()
-        if system == "Windows":
-            subprocess.run(["rundll32.exe", "user32.dll,LockWorkStation"])
-        elif system == "Darwin":  # macOS
-            subprocess.run([
-                '/System/Library/CoreServices/Menu Extras/User.menu/Contents/Resources/CGSession',
-                '-suspend'
-            ])
-        elif system == "Linux":
-            try:
-                subprocess.run(["gnome-screensaver-command", "-l"])
-            except:
-                subprocess.run(["xdg-screensaver", "lock"])
-        else:
-            log_event("Lock not supported on this OS")
-    except Exception as e:
-        log_event(f"Lock screen error: {e}")
+LOCK_COMMANDS = {
+    "Windows": [["rundll32.exe", "user32.dll,LockWorkStation"]],
+    "Darwin": [[  # macOS
+        '/System/Library/CoreServices/Menu Extras/User.menu/Contents/Resources/CGSession',
+        '-suspend'
+    ]],
+    "Linux": [
+        ["gnome-screensaver-command", "-l"],
+        ["xdg-screensaver", "lock"],
+        ["loginctl", "lock-session"],
+    ],
+}
+
+_lock_command = None
+
+
+def available_lock_commands():
+    """Lock commands for this OS that exist on this machine, the last one that worked first."""
+    commands = [command for command in LOCK_COMMANDS.get(platform.system(), [])
+                if shutil.which(command[0]) or os.path.exists(command[0])]
+    if _lock_command in commands:
+        commands.remove(_lock_command)
+        commands.insert(0, _lock_command)
+    return commands
+
+
+def lock_screen(timeout=5.0):
+    """Lock the session with the first command that succeeds and remember it for next time."""
+    global _lock_command
+    commands = available_lock_commands()
+    if not commands:
+        log_event("Lock not supported on this OS", "error")
+        return False
+    for command in commands:
+        try:
+            result = subprocess.run(command, timeout=timeout)
+            if result.returncode != 0:
+                raise RuntimeError(f"{command[0]} exited with {result.returncode}")
+        except Exception as e:
+            log_event(f"Lock screen error: {e}", "error")
+            continue
+        _lock_command = command
+        return True
+    _lock_command = None
+    return False
 
 
 # -------------------- Notifications --------------------
@@ -53,54 +128,741 @@ def notify_user(title, message, duration=3):
         print(f"Notification error: {e}")
 
 
+# -------------------- Action Dispatcher --------------------
+class ActionDispatcher:
+    """Carries out notify/beep/lock actions on worker threads.
+
+    submit() only enqueues, so a slow notification daemon or lock command
+    never holds up detection. Locks have their own lane and worker, and a
+    notification is given at most notify_timeout seconds, so a hung
+    notification daemon can delay further notifications but never a lock.
+    A notification identical to one sent in the last notify_min_interval
+    seconds, or to one still queued, is dropped. Time taken by each action
+    is recorded in metrics as action_<kind>.
+    """
+
+    def __init__(self, notify_min_interval=10.0, lock_timeout=5.0, metrics=None, max_pending=32,
+                 notify_timeout=5.0):
+        self.notify_min_interval = notify_min_interval
+        self.lock_timeout = lock_timeout
+        self.notify_timeout = notify_timeout
+        self.metrics = metrics
+        self.queues = {"lock": queue.Queue(maxsize=max_pending), "alert": queue.Queue(maxsize=max_pending)}
+        self.pending = set()
+        self.last_sent = {}
+        self.dropped = 0
+        self.notifier = None  # Thread of a notification that overran notify_timeout
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @staticmethod
+    def lane(action):
+        return "lock" if action[0] == "lock" else "alert"
+
+    def start(self):
+        self.stopped.clear()
+        self._threads = [threading.Thread(target=self._run, args=(q,), daemon=True) for q in self.queues.values()]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, action):
+        with self._lock:
+            if action in self.pending:
+                self.dropped += 1
+                return False
+            if action[0] == "notify" and \
+                    time.monotonic() - self.last_sent.get(action, -1e9) < self.notify_min_interval:
+                self.dropped += 1
+                return False
+            try:
+                self.queues[self.lane(action)].put_nowait(action)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self.pending.add(action)
+        return True
+
+    def _run(self, actions):
+        while not self.stopped.is_set():
+            try:
+                action = actions.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if action is None:
+                break
+            start = time.perf_counter()
+            try:
+                self.execute(action)
+            except Exception as e:
+                log_event(f"Error running {action[0]} action: {e}", "error")
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.pending.discard(action)
+                self.last_sent[action] = time.monotonic()
+            if self.metrics is not None:
+                self.metrics.observe(f"action_{action[0]}", elapsed)
+                self.metrics.set("actions_dropped", self.dropped)
+
+    def execute(self, action):
+        if action[0] == "notify":
+            self.notify(action[1], action[2])
+        elif action[0] == "beep":
+            if platform.system() == "Windows":
+                winsound.MessageBeep(winsound.MB_ICONEXCLAMATION)
+        elif action[0] == "lock":
+            lock_screen(self.lock_timeout)
+
+    def notify(self, title, message):
+        """Run notify_user() for at most notify_timeout seconds; plyer itself has no timeout."""
+        if self.notifier is not None and self.notifier.is_alive():
+            self.dropped += 1  # The previous notification is still stuck in the daemon
+            return
+        thread = threading.Thread(target=notify_user, args=(title, message), daemon=True)
+        thread.start()
+        thread.join(self.notify_timeout)
+        if thread.is_alive():
+            self.notifier = thread
+            log_event(f"Notification did not finish within {self.notify_timeout:g}s.", "warning")
+
+    def stop(self, timeout=1.0):
+        self.stopped.set()
+        for actions in self.queues.values():
+            try:
+                actions.put_nowait(None)  # Wakes an idle worker at once; a full queue still sees stopped
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+
+
 # -------------------- Settings --------------------
+DEFAULT_SETTINGS = {
+    "sensitivity": 5,
+    "timeout": 10,
+    "preview_size": 300,
+    "autostart": False,
+    "enable_sound": True,
+    "enable_notifications": True,
+    "check_interval": 1.0,
+    "show_logs": True,  # New setting to control log visibility
+    "frame_buffer_size": 2,
+    "motion_gate": True,
+    "motion_threshold": 0.02,
+    "force_detect_interval": 5.0,
+    "tracking": True,
+    "redetect_every": 10,  # Frames tracked between full detector runs
+    "track_min_confidence": 0.6,
+    "detector": "caffe_ssd",  # caffe_ssd, yunet, yunet_int8 or haar
+    "detection_confidence": 0.5,
+    "nms_threshold": 0.3,
+    "metrics_port": 0,  # Serve Prometheus metrics on localhost when non-zero
+    "metrics_snapshot_file": "",
+    "metrics_snapshot_interval": 10.0,
+    "ui_refresh_ms": 100,  # How often the window applies queued status and log updates
+    "log_capacity": 1000,  # Lines kept in memory and in the log window
+    "log_level": "info",  # debug, info, warning or error
+    "log_file": "face_monitor.log",  # Size-rotated log file; empty to disable
+    "log_max_bytes": 1000000,
+    "log_backup_count": 3,
+    "notify_min_interval": 10.0,  # Seconds before an identical notification may be shown again
+    "lock_timeout": 5.0,  # Seconds to wait for the lock command
+    "detection_process": False,  # Run the detector in a separate process
+    "sources": [],  # Frame sources, e.g. ["webcam:0", "webcam:1"]; empty means webcam 0
+    "server_port": 5055,  # Port of the --serve detection server on localhost
+    "server_batch_window_ms": 15,  # Longest a frame waits for other sessions to share its batch
+    "server_max_batch": 16,
+    "server_decode_workers": 4,
+    "server_session_timeout": 300,  # Seconds without frames before a web session is dropped
+    "server_allowed_origin": "http://localhost:5173",  # Web client origin allowed by CORS (Vite dev server)
+    "server_jwt_secret": "",  # JWT_SECRET of the web API; session routes need a Bearer token it signed
+    "evidence_buffer": False,  # Save a short clip around multiple-face and lock events
+    "evidence_dir": "evidence",
+    "evidence_memory_mb": 16,  # Memory cap of the pre-event frame buffer
+    "evidence_pre_roll": 10.0,  # Seconds kept before an event
+    "evidence_post_roll": 3.0,  # Seconds recorded after an event
+    "evidence_fps": 5.0,
+    "capture_negotiation": True,  # Pick the cheapest camera mode that still suits the detector
+    "identity_check": False,  # Warn when the face in view is not the person seen at start
+    "identity_threshold": 0.363,  # SFace cosine similarity needed to count as the same person
+    # Stricter bound for detectors without landmarks: unaligned crops share background and lighting,
+    # which lifts the similarity of different people at the same desk
+    "identity_threshold_unaligned": 0.5,
+    "identity_refresh": 10.0,  # Seconds before a steady face is embedded again
+    "adaptive_interval": True,  # Vary the check interval with presence state and CPU load
+    "min_check_interval": 0.2,  # Fastest checks: after a change and near the lock deadline
+    "max_check_interval": 3.0,  # Slowest checks: one face steadily present
+    "high_cpu_load": 0.85,  # System CPU use (0-1) above which checks back off
+    "preview_fps": 10.0,  # Refresh cap of the preview window
+    "journal_file": "presence_journal.db",  # SQLite journal of presence changes; empty to disable
+    "sync_url": "",  # e.g. http://localhost:5000/api/analytics/presence/batch; empty keeps events local
+    "sync_token": "",  # Bearer token sent with uploads
+    "course_id": "",  # Course and lesson stamped on journaled events, so course presence reports include them
+    "lesson_id": "",
+    "sync_interval": 5.0,
+    "sync_batch_size": 500,
+    "presence_smoothing": True,  # Decide on a window of recent frames instead of the last one
+    "smoothing_window": 5,  # Frames in the window
+    "smoothing_enter": 0.6,  # Share of the window a face count needs to become the state
+    "smoothing_exit": 0.4  # Share below which the current face count is given up
+}
+
+# Allowed ranges for numeric settings; out-of-range values are clamped
+SETTINGS_RANGES = {
+    "sensitivity": (1, 30),
+    "timeout": (5, 300),
+    "preview_size": (100, 500),
+    "check_interval": (0.05, 5.0),
+    "frame_buffer_size": (2, 16),
+    "motion_threshold": (0.0, 1.0),
+    "force_detect_interval": (0.5, 300.0),
+    "redetect_every": (1, 1000),
+    "track_min_confidence": (0.0, 1.0),
+    "detection_confidence": (0.05, 1.0),
+    "nms_threshold": (0.0, 1.0),
+    "ui_refresh_ms": (20, 2000),
+    "log_capacity": (10, 100000),
+    "server_batch_window_ms": (0, 1000),
+    "server_max_batch": (1, 64),
+    "server_decode_workers": (1, 64),
+    "server_session_timeout": (10, 86400),
+    "evidence_memory_mb": (1, 1024),
+    "evidence_pre_roll": (0.0, 120.0),
+    "evidence_post_roll": (0.0, 60.0),
+    "evidence_fps": (0.5, 30.0),
+    "identity_threshold": (-1.0, 1.0),
+    "identity_threshold_unaligned": (-1.0, 1.0),
+    "identity_refresh": (1.0, 600.0),
+    "min_check_interval": (0.05, 5.0),
+    "max_check_interval": (0.05, 30.0),
+    "high_cpu_load": (0.1, 1.0),
+    "preview_fps": (1.0, 60.0),
+    "sync_interval": (0.5, 3600.0),
+    "sync_batch_size": (1, 10000),
+    "smoothing_window": (1, 256),
+    "smoothing_enter": (0.0, 1.0),
+    "smoothing_exit": (0.0, 1.0),
+}
+
+
+def validate_settings(settings):
+    """Merge settings over the defaults, coercing each value to its default's type."""
+    result = dict(DEFAULT_SETTINGS)
+    for key, value in settings.items():
+        default = DEFAULT_SETTINGS.get(key)
+        if default is not None:
+            try:
+                if isinstance(default, list) and not isinstance(value, list):
+                    raise TypeError(key)
+                value = type(default)(value)
+            except (TypeError, ValueError):
+                log_event(f"Invalid value for {key}: {value!r}, using {default!r}", "warning")
+                value = default
+        if key in SETTINGS_RANGES:
+            low, high = SETTINGS_RANGES[key]
+            value = min(max(value, low), high)
+        result[key] = value
+    if result["smoothing_exit"] >= result["smoothing_enter"]:
+        # Without a gap between the two shares the smoothed count flips back and forth
+        log_event(f"smoothing_exit ({result['smoothing_exit']}) must be below smoothing_enter "
+                  f"({result['smoothing_enter']}), using {DEFAULT_SETTINGS['smoothing_exit']} and "
+                  f"{DEFAULT_SETTINGS['smoothing_enter']}", "warning")
+        result["smoothing_exit"] = DEFAULT_SETTINGS["smoothing_exit"]
+        result["smoothing_enter"] = DEFAULT_SETTINGS["smoothing_enter"]
+    return result
+
+
+class SettingsStore:
+    """Cached, validated view of settings.json.
+
+    The file is re-parsed only when its modification time or size changes,
+    writes go through a temporary file and os.replace so readers never see a
+    half-written file, and subscribers are called with the new settings after
+    every save or detected external edit.
+    """
+
+    def __init__(self, path="settings.json"):
+        self.path = path
+        self._settings = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._watcher = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def get(self):
+        """Return a copy of the current settings, reloading the file if it changed."""
+        changed = False
+        with self._lock:
+            signature = self._file_signature()
+            if self._settings is None or signature != self._signature:
+                changed = self._settings is not None
+                self._settings = self._read()
+                self._signature = signature
+            settings = dict(self._settings)
+        if changed:
+            self._notify(settings)
+        return settings
+
+    def _read(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    return validate_settings(json.load(f))
+        except Exception as e:
+            log_event(f"Error loading settings: {e}", "error")
+        return dict(DEFAULT_SETTINGS)
+
+    def save(self, settings):
+        settings = validate_settings(settings)
+        with self._lock:
+            try:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(settings, f, indent=4)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                log_event(f"Error saving settings: {e}", "error")
+                return
+            self._settings = settings
+            self._signature = self._file_signature()
+        self._notify(dict(settings))
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, settings):
+        for callback in list(self._subscribers):
+            try:
+                callback(settings)
+            except Exception as e:
+                log_event(f"Error applying settings: {e}", "error")
+
+    def watch(self, interval=2.0):
+        """Poll the file in the background so external edits reach subscribers."""
+        if self._watcher is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                self.get()
+
+        self._watcher = threading.Thread(target=poll, daemon=True)
+        self._watcher.start()
+
+
+settings_store = SettingsStore()
+
+
 def save_settings(settings):
-    try:
-        with open("settings.json", "w") as f:
-            json.dump(settings, f, indent=4)
-    except Exception as e:
-        log_event(f"Error saving settings: {e}")
+    settings_store.save(settings)
 
 
 def load_settings():
-    default_settings = {
-        "sensitivity": 5,
-        "timeout": 10,
-        "preview_size": 300,
-        "autostart": False,
-        "enable_sound": True,
-        "enable_notifications": True,
-        "check_interval": 1.0,
-        "show_logs": True  # New setting to control log visibility
-    }
-    
-    try:
-        if os.path.exists("settings.json"):
-            with open("settings.json", "r") as f:
-                loaded_settings = json.load(f)
-                # Merge with default settings to ensure all keys exist
-                for key in default_settings:
-                    if key not in loaded_settings:
-                        loaded_settings[key] = default_settings[key]
-                return loaded_settings
-    except Exception as e:
-        log_event(f"Error loading settings: {e}")
-    
-    return default_settings
+    return settings_store.get()
+
+
+# -------------------- UI Bus --------------------
+class UIBus:
+    """Thread-safe hand-off of status, log and command updates to the Tk main loop.
+
+    Any thread may publish; nothing touches Tk until the main loop pumps the
+    bus every interval_ms. Status updates are coalesced to the latest value
+    and repeats of the last published status are dropped at the source.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = None
+        self._pending_status = None
+        self._logs = collections.deque(maxlen=1000)
+        self._calls = []
+        self._status_listeners = []
+        self.root = None
+        self.on_status = None
+        self.on_logs = None
+        self.interval_ms = 100
+        self.coalesced = 0
+
+    @property
+    def attached(self):
+        return self.root is not None
+
+    def publish_status(self, text, color):
+        with self._lock:
+            if (text, color) == self._status:
+                return
+            if self._pending_status is not None:
+                self.coalesced += 1
+            self._status = self._pending_status = (text, color)
+
+    def publish_log(self, line):
+        with self._lock:
+            self._logs.append(line)
+
+    def call(self, fn, *args):
+        """Run fn(*args) on the Tk main loop."""
+        with self._lock:
+            self._calls.append((fn, args))
+
+    def subscribe_status(self, listener):
+        """Also deliver status updates to listener(text, color), e.g. the tray icon."""
+        self._status_listeners.append(listener)
+
+    def unsubscribe_status(self, listener):
+        if listener in self._status_listeners:
+            self._status_listeners.remove(listener)
+
+    def attach(self, root, on_status, on_logs, interval_ms=100):
+        self.root = root
+        self.on_status = on_status
+        self.on_logs = on_logs
+        self.interval_ms = interval_ms
+        root.after(interval_ms, self._pump)
+
+    def _pump(self):
+        with self._lock:
+            status, self._pending_status = self._pending_status, None
+            logs = list(self._logs)
+            self._logs.clear()
+            calls, self._calls = self._calls, []
+        try:
+            for fn, args in calls:
+                fn(*args)
+            if logs:
+                self.on_logs(logs)
+            if status:
+                self.on_status(*status)
+                for listener in list(self._status_listeners):
+                    listener(*status)
+        except Exception as e:
+            print(f"UI update error: {e}")
+        finally:
+            self.root.after(self.interval_ms, self._pump)
+
+
+ui_bus = UIBus()
 
 
 # -------------------- Logging --------------------
-def log_event(msg):
-    try:
-        if 'log_text' in globals():
-            log_text.config(state=tk.NORMAL)
-            log_text.insert(tk.END, time.strftime("%Y-%m-%d %H:%M:%S") + " - " + msg + "\n")
-            log_text.yview(tk.END)
-            log_text.config(state=tk.DISABLED)
+LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+class EventLog:
+    """Backend of log_event.
+
+    Keeps the last `capacity` lines in memory, forwards them to the window in
+    batches through the UI bus and, when a log file is configured, hands them
+    to a size-rotated file written by a background listener thread. Messages
+    below the configured level are dropped but still counted per level.
+    """
+
+    def __init__(self, capacity=1000, level="info"):
+        self.capacity = capacity
+        self.level = LOG_LEVELS[level]
+        self.records = collections.deque(maxlen=capacity)
+        self.counts = collections.Counter()
+        self.suppressed = collections.Counter()
+        self._logger = logging.getLogger("face_monitor")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.DEBUG)
+        self._listener = None
+
+    def configure(self, capacity=1000, level="info", log_file="", max_bytes=1000000, backup_count=3):
+        self.capacity = capacity
+        self.level = LOG_LEVELS.get(level, logging.INFO)
+        self.records = collections.deque(self.records, maxlen=capacity)
+        ui_bus._logs = collections.deque(ui_bus._logs, maxlen=capacity)
+        self.stop()
+        if log_file:
+            try:
+                handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                               backupCount=backup_count, encoding="utf-8")
+            except OSError as e:
+                self.log(f"Could not open log file {log_file}: {e}", "error")
+                return
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+            log_queue = queue.SimpleQueue()
+            self._logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            self._listener = logging.handlers.QueueListener(log_queue, handler)
+            self._listener.start()
+
+    def log(self, msg, level="info"):
+        self.counts[level] += 1
+        if LOG_LEVELS[level] < self.level:
+            self.suppressed[level] += 1
+            return
+        line = time.strftime("%Y-%m-%d %H:%M:%S") + " - " + msg
+        self.records.append(line)
+        if ui_bus.attached:
+            ui_bus.publish_log(line)
         else:
-            print(time.strftime("%Y-%m-%d %H:%M:%S") + " - " + msg)
-    except Exception as e:
-        print(f"Log error: {e}")
+            print(line)
+        if self._listener is not None:
+            self._logger.log(LOG_LEVELS[level], msg)
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+
+
+event_log = EventLog()
+atexit.register(event_log.stop)
+
+
+def log_event(msg, level="info"):
+    event_log.log(msg, level)
+
+
+def configure_logging(settings):
+    event_log.configure(settings["log_capacity"], settings["log_level"], settings["log_file"],
+                        settings["log_max_bytes"], settings["log_backup_count"])
+
+
+# -------------------- Presence Journal --------------------
+class PresenceJournal:
+    """Append-only SQLite (WAL) journal of presence changes, written in batches by a background thread.
+
+    record() only puts a tuple on a bounded queue, so callers on the
+    detection path never wait for the disk; when the queue is full the
+    event is dropped and counted.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            time REAL NOT NULL,
+            session TEXT NOT NULL,
+            state TEXT NOT NULL,
+            faces INTEGER NOT NULL,
+            course TEXT, lesson TEXT, user TEXT, source TEXT
+        );
+        CREATE TABLE IF NOT EXISTS batches (
+            batch_id TEXT PRIMARY KEY,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            created REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            uploaded REAL,
+            rejected REAL,
+            status INTEGER
+        );
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_pending)
+        self.written = 0
+        self.dropped = 0
+        self.thread = None
+
+    @staticmethod
+    def connect(path):
+        conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(PresenceJournal.SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(batches)")}
+        for column, kind in (("rejected", "REAL"), ("status", "INTEGER")):
+            if column not in columns:  # Journals created before the column existed
+                conn.execute(f"ALTER TABLE batches ADD COLUMN {column} {kind}")
+        return conn
+
+    def start(self):
+        self.connect(self.path).close()  # Fail early on an unusable path
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def record(self, session, state, faces, course=None, lesson=None, user=None, source=None):
+        try:
+            self.queue.put_nowait((time.time(), session, state, faces, course, lesson, user, source))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        conn = self.connect(self.path)
+        stopping = False
+        while not stopping:
+            try:
+                event = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while event is not None:
+                batch.append(event)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if event is None:
+                stopping = True
+            if batch:
+                try:
+                    with conn:
+                        conn.executemany("INSERT INTO events (time, session, state, faces, course, lesson, user, "
+                                         "source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    self.dropped += len(batch)
+                    log_event(f"Error writing presence journal: {e}", "error")
+        conn.close()
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+
+class JournalSync(threading.Thread):
+    """Uploads journaled events in bulk, retrying failures with exponential backoff.
+
+    Events are cut into batches whose id and event range are stored in the
+    journal before the first upload, so a retry - even after a restart -
+    resends exactly the same batch under the same id and the server can
+    ignore duplicates. A batch the server refuses with a 4xx status (other
+    than 408/429) will not succeed on retry; it is marked rejected and kept
+    in the journal so it does not hold back later batches.
+    """
+
+    RETRYABLE_STATUS = (408, 429)
+
+    def __init__(self, path, url, token="", batch_size=500, interval=5.0, max_backoff=300.0, timeout=10.0):
+        super().__init__(daemon=True)
+        self.path = path
+        self.url = url
+        self.token = token
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.stopped = threading.Event()
+        self.uploaded = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def run(self):
+        conn = PresenceJournal.connect(self.path)
+        while not self.stopped.is_set():
+            batch = self.next_batch(conn)
+            if batch is None:
+                self.stopped.wait(self.interval)
+                continue
+            batch_id, first_id, last_id, attempts = batch
+            status = self.upload(conn, batch_id, first_id, last_id)
+            if status is not None and status < 300:
+                with conn:
+                    conn.execute("UPDATE batches SET uploaded = ?, status = ?, attempts = attempts + 1 "
+                                 "WHERE batch_id = ?", (time.time(), status, batch_id))
+                self.uploaded += last_id - first_id + 1
+                continue
+            if status is not None and 400 <= status < 500 and status not in self.RETRYABLE_STATUS:
+                with conn:
+                    conn.execute("UPDATE batches SET rejected = ?, status = ?, attempts = attempts + 1 "
+                                 "WHERE batch_id = ?", (time.time(), status, batch_id))
+                self.rejected += last_id - first_id + 1
+                log_event(f"Presence sync batch {batch_id} rejected with HTTP {status}; "
+                          f"its {last_id - first_id + 1} events stay in the journal only.", "error")
+                continue
+            self.failures += 1
+            with conn:
+                conn.execute("UPDATE batches SET status = ?, attempts = attempts + 1 WHERE batch_id = ?",
+                             (status, batch_id))
+            delay = min(self.max_backoff, self.interval * 2 ** attempts) * random.uniform(0.5, 1.0)
+            self.stopped.wait(delay)
+        conn.close()
+
+    def next_batch(self, conn):
+        """The oldest batch not yet acknowledged, cutting a new one from unbatched events if needed."""
+        row = conn.execute("SELECT batch_id, first_id, last_id, attempts FROM batches "
+                           "WHERE uploaded IS NULL AND rejected IS NULL ORDER BY first_id LIMIT 1").fetchone()
+        if row:
+            return row
+        last = conn.execute("SELECT COALESCE(MAX(last_id), 0) FROM batches").fetchone()[0]
+        ids = conn.execute("SELECT MIN(id), MAX(id) FROM (SELECT id FROM events WHERE id > ? ORDER BY id LIMIT ?)",
+                           (last, self.batch_size)).fetchone()
+        if ids[0] is None:
+            return None
+        batch_id = uuid.uuid4().hex
+        with conn:
+            conn.execute("INSERT INTO batches (batch_id, first_id, last_id, created) VALUES (?, ?, ?, ?)",
+                         (batch_id, ids[0], ids[1], time.time()))
+        return batch_id, ids[0], ids[1], 0
+
+    def upload(self, conn, batch_id, first_id, last_id):
+        """POST one batch; returns the HTTP status, or None when the server could not be reached."""
+        rows = conn.execute("SELECT id, time, session, state, faces, course, lesson, user, source FROM events "
+                            "WHERE id BETWEEN ? AND ? ORDER BY id", (first_id, last_id)).fetchall()
+        events = [{"id": r[0], "time": r[1], "sessionId": r[2], "state": r[3], "faces": r[4], "courseId": r[5],
+                   "lessonId": r[6], "userId": r[7], "source": r[8]} for r in rows]
+        body = json.dumps({"batchId": batch_id, "events": events}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url, body, headers),
+                                        timeout=self.timeout) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            if not 400 <= e.code < 500 or e.code in self.RETRYABLE_STATUS:
+                log_event(f"Presence sync of batch {batch_id} failed: {e}", "warning")
+            return e.code
+        except (urllib.error.URLError, OSError) as e:
+            log_event(f"Presence sync of batch {batch_id} failed: {e}", "warning")
+            return None
+
+    def stop(self):
+        self.stopped.set()
+
+
+presence_journal = None
+journal_sync = None
+
+
+def start_journal(settings):
+    """Open the presence journal and, when sync_url is set, start uploading it."""
+    global presence_journal, journal_sync
+    if not settings["journal_file"] or presence_journal is not None:
+        return
+    try:
+        presence_journal = PresenceJournal(settings["journal_file"]).start()
+    except sqlite3.Error as e:
+        log_event(f"Presence journal disabled: {e}", "warning")
+        return
+    if settings["sync_url"]:
+        journal_sync = JournalSync(settings["journal_file"], settings["sync_url"], settings["sync_token"],
+                                   settings["sync_batch_size"], settings["sync_interval"])
+        journal_sync.start()
+    atexit.register(stop_journal)
+
+
+def stop_journal():
+    global presence_journal, journal_sync
+    if journal_sync is not None:
+        journal_sync.stop()
+        journal_sync = None
+    if presence_journal is not None:
+        presence_journal.stop()
+        presence_journal = None
 
 
 # -------------------- Auto-start --------------------
@@ -156,187 +918,3350 @@ X-GNOME-Autostart-enabled=true
         log_event(f"Error enabling autostart: {e}")
 
 
-def disable_autostart(app_name="FaceMonitor"):
-    try:
-        system = platform.system()
-        if system == "Windows":
-            startup = os.path.join(os.getenv('APPDATA'), "Microsoft\\Windows\\Start Menu\\Programs\\Startup")
-            shortcut = os.path.join(startup, f"{app_name}.bat")
-            if os.path.exists(shortcut):
-                os.remove(shortcut)
-                log_event("Autostart disabled.")
-        elif system == "Darwin":
-            plist_path = os.path.expanduser(f"~/Library/LaunchAgents/com.{app_name.lower()}.plist")
-            if os.path.exists(plist_path):
-                os.remove(plist_path)
-                log_event("Autostart disabled for macOS.")
-        elif system == "Linux":
-            desktop_path = os.path.expanduser(f"~/.config/autostart/{app_name}.desktop")
-            if os.path.exists(desktop_path):
-                os.remove(desktop_path)
-                log_event("Autostart disabled for Linux.")
-    except Exception as e:
-        log_event(f"Error disabling autostart: {e}")
+def disable_autostart(app_name="FaceMonitor"):
+    try:
+        system = platform.system()
+        if system == "Windows":
+            startup = os.path.join(os.getenv('APPDATA'), "Microsoft\\Windows\\Start Menu\\Programs\\Startup")
+            shortcut = os.path.join(startup, f"{app_name}.bat")
+            if os.path.exists(shortcut):
+                os.remove(shortcut)
+                log_event("Autostart disabled.")
+        elif system == "Darwin":
+            plist_path = os.path.expanduser(f"~/Library/LaunchAgents/com.{app_name.lower()}.plist")
+            if os.path.exists(plist_path):
+                os.remove(plist_path)
+                log_event("Autostart disabled for macOS.")
+        elif system == "Linux":
+            desktop_path = os.path.expanduser(f"~/.config/autostart/{app_name}.desktop")
+            if os.path.exists(desktop_path):
+                os.remove(desktop_path)
+                log_event("Autostart disabled for Linux.")
+    except Exception as e:
+        log_event(f"Error disabling autostart: {e}")
+
+
+# -------------------- Metrics --------------------
+class RollingHistogram:
+    """Latest `size` samples of one measurement plus lifetime count and sum."""
+
+    def __init__(self, size=1024):
+        self.samples = np.zeros(size, dtype=np.float64)
+        self.size = size
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples[self.count % self.size] = value
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        window = self.samples[:min(self.count, self.size)]
+        if not len(window):
+            return [0.0] * len(quantiles)
+        return np.percentile(window, quantiles).tolist()
+
+
+class MonitorMetrics:
+    """Per-stage timings and counters for the monitor loop.
+
+    observe() and inc() are cheap enough to call on every frame; percentiles
+    are only computed when a snapshot or Prometheus scrape asks for them.
+    Counters only grow (set() mirrors a running total kept elsewhere);
+    values that go up and down, like the current interval, are gauges.
+    Monitor, dispatcher and exporter threads share one instance, so dict
+    updates and the snapshot copy take self.lock.
+    """
+
+    STAGES = ("capture", "resize", "blob", "forward", "postprocess", "preview", "decide", "sleep", "frame_age")
+    QUANTILES = (50, 95, 99)
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.stages = {stage: RollingHistogram(window) for stage in self.STAGES}
+        self.counters = {}
+        self.gauges = {}
+        self.states = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            with self.lock:
+                hist = self.stages.setdefault(stage, RollingHistogram(self.window))
+        hist.observe(seconds)
+
+    def inc(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set(self, counter, value):
+        with self.lock:
+            self.counters[counter] = value
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def count_state(self, state):
+        with self.lock:
+            self.states[state] = self.states.get(state, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            hists = list(self.stages.items())
+            counters, gauges, states = dict(self.counters), dict(self.gauges), dict(self.states)
+        stages = {}
+        for stage, hist in hists:  # Percentiles outside the lock so the monitor loop never waits on them
+            p50, p95, p99 = hist.percentiles(self.QUANTILES)
+            stages[stage] = {"p50": p50, "p95": p95, "p99": p99, "count": hist.count, "sum": hist.sum}
+        return {
+            "timestamp": time.time(),
+            "uptime": time.time() - self.started,
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+            "states": states,
+        }
+
+    def prometheus(self):
+        snap = self.snapshot()
+        lines = ["# HELP face_monitor_stage_seconds Time spent per monitor loop stage.",
+                 "# TYPE face_monitor_stage_seconds summary"]
+        for stage, stats in snap["stages"].items():
+            for q in self.QUANTILES:
+                lines.append(f'face_monitor_stage_seconds{{stage="{stage}",quantile="{q / 100}"}} {stats[f"p{q}"]:.6f}')
+            lines.append(f'face_monitor_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+            lines.append(f'face_monitor_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for counter, value in sorted(snap["counters"].items()):
+            lines.append(f"# TYPE face_monitor_{counter}_total counter")
+            lines.append(f"face_monitor_{counter}_total {value}")
+        for gauge, value in sorted(snap["gauges"].items()):
+            lines.append(f"# TYPE face_monitor_{gauge} gauge")
+            lines.append(f"face_monitor_{gauge} {value}")
+        lines.append("# TYPE face_monitor_decisions_total counter")
+        for state, value in sorted(snap["states"].items()):
+            lines.append(f'face_monitor_decisions_total{{state="{state}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Opt-in localhost Prometheus endpoint and periodic JSON snapshot file for MonitorMetrics."""
+
+    def __init__(self, metrics, port=0, snapshot_file="", snapshot_interval=10.0):
+        self.metrics = metrics
+        self.port = port
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self.server = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.port:
+            from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+                self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever, daemon=True).start()
+                log_event(f"Metrics available at http://127.0.0.1:{self.port}/metrics")
+            except OSError as e:
+                log_event(f"Could not start metrics endpoint: {e}")
+        if self.snapshot_file:
+            threading.Thread(target=self._write_snapshots, daemon=True).start()
+
+    def _write_snapshots(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        try:
+            tmp = self.snapshot_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.metrics.snapshot(), f, indent=2)
+            os.replace(tmp, self.snapshot_file)
+        except Exception as e:
+            log_event(f"Error writing metrics snapshot: {e}", "error")
+
+    def stop(self):
+        self._stop.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.snapshot_file:
+            self.write_snapshot()
+
+
+# -------------------- Frame Sources --------------------
+class FrameSource:
+    """Where frames come from. read(out) may fill out in place and returns (ok, frame).
+
+    timestamp is the time of the last frame read, in seconds: wall-clock
+    monotonic time for live cameras and position in the recording otherwise.
+    """
+
+    name = "source"
+
+    def __init__(self):
+        self.timestamp = 0.0
+
+    def open(self):
+        return True
+
+    def read(self, out=None):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+# Capture sizes tried from smallest up, and pixel formats compared at each size
+CAPTURE_SIZES = [(320, 240), (424, 240), (640, 360), (640, 480), (800, 600), (960, 720), (1280, 720),
+                 (1920, 1080)]
+CAPTURE_FOURCCS = ("MJPG", "YUYV")
+_capture_profiles = {}  # Negotiated (width, height, fourcc) per camera and request, for quick restarts
+
+
+def fourcc_name(value):
+    value = int(value)
+    return "".join(chr((value >> 8 * i) & 0xFF) for i in range(4)) if value > 0 else "default"
+
+
+def request_capture_profile(source, detector_name, check_interval):
+    """Have a webcam negotiate the smallest mode covering the detector input at the detection rate."""
+    if isinstance(source, WebcamSource):
+        min_size = DETECTOR_BACKENDS.get(detector_name, CaffeSSDDetector)().input_size(640, 480)
+        source.request_profile(min_size, max(5, int(round(1.0 / check_interval))))
+
+
+class WebcamSource(FrameSource):
+    def __init__(self, index=0):
+        super().__init__()
+        self.index = index
+        self.name = f"webcam {index}"
+        self.cap = None
+        self.min_size = None  # Set by request_profile(); None keeps the driver defaults
+        self.max_fps = None
+        self.profile = None
+
+    def request_profile(self, min_size, max_fps):
+        self.min_size = tuple(min_size)
+        self.max_fps = max_fps
+
+    def open(self):
+        if self.cap is not None and self.cap.isOpened():
+            return True  # Already opened, e.g. by StartupPrefetch
+        # Try different backends to open camera
+        for backend in (cv2.CAP_DSHOW, cv2.CAP_ANY):
+            self.cap = cv2.VideoCapture(self.index, backend)
+            if self.cap.isOpened():
+                if self.min_size is not None and not self.negotiate():
+                    # Leave a camera that rejected every profile in its default mode
+                    self.cap.release()
+                    self.cap = cv2.VideoCapture(self.index, backend)
+                return self.cap.isOpened()
+        return False
+
+    def negotiate(self):
+        """Try capture profiles from the smallest size that covers min_size upwards.
+
+        At the first size that delivers frames every pixel format is compared
+        by the time retrieve() takes to decode a frame, and the cheapest wins.
+        Returns False when no profile worked.
+        """
+        key = (self.index, self.min_size, self.max_fps)
+        if key in _capture_profiles:
+            candidates = [_capture_profiles[key]]
+        else:
+            candidates = [(w, h, fourcc) for (w, h) in CAPTURE_SIZES
+                          if w >= self.min_size[0] and h >= self.min_size[1] for fourcc in CAPTURE_FOURCCS]
+        best = None
+        tried = None
+        for profile in candidates:
+            if best is not None and profile[:2] != best[0][:2]:
+                break
+            cost = self._try_profile(profile)
+            tried = profile
+            if cost is not None and (best is None or cost < best[1]):
+                best = (profile, cost)
+        if best is None:
+            log_event(f"{self.name}: no capture profile covering {self.min_size[0]}x{self.min_size[1]} worked; "
+                      f"using camera defaults.", "warning")
+            return False
+
+        profile, cost = best
+        if profile != tried:
+            cost = self._try_profile(profile) or cost
+        self.cap.set(cv2.CAP_PROP_FPS, self.max_fps)
+        _capture_profiles[key] = profile
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.profile = (width, height, fourcc_name(self.cap.get(cv2.CAP_PROP_FOURCC)),
+                        self.cap.get(cv2.CAP_PROP_FPS))
+        log_event(f"{self.name}: capturing {width}x{height} {self.profile[2]} at {self.profile[3]:g} fps "
+                  f"(requested {profile[0]}x{profile[1]} {profile[2]}, max {self.max_fps} fps), "
+                  f"{cost * 1000:.1f} ms decode per frame.")
+        return True
+
+    def _try_profile(self, profile, frames=3):
+        """Switch to a profile and return the median retrieve() time, or None if it fails or is too small."""
+        (w, h, fourcc) = profile
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
+        costs = []
+        frame = None
+        for i in range(frames + 1):
+            if not self.cap.grab():
+                return None
+            start = time.perf_counter()
+            ok, frame = self.cap.retrieve(frame)
+            if not ok or frame is None:
+                return None
+            if i:  # The first frame after a mode switch is often slow
+                costs.append(time.perf_counter() - start)
+        if frame.shape[1] < self.min_size[0] or frame.shape[0] < self.min_size[1]:
+            return None
+        return statistics.median(costs)
+
+    def read(self, out=None):
+        ok, frame = self.cap.read(out)
+        self.timestamp = time.monotonic()
+        return ok, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class VideoFileSource(FrameSource):
+    EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm", ".m4v")
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.name = os.path.basename(path)
+        self.cap = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.path)
+        return self.cap.isOpened()
+
+    def read(self, out=None):
+        ok, frame = self.cap.read(out)
+        self.timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        return ok, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+    """Plays the images of a directory in name order at a fixed frame rate."""
+
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, path, fps=10.0):
+        super().__init__()
+        self.path = path
+        self.fps = fps
+        self.name = os.path.basename(os.path.normpath(path))
+        self.files = []
+        self.index = 0
+
+    def open(self):
+        self.files = sorted(f for f in os.listdir(self.path) if f.lower().endswith(self.EXTENSIONS))
+        self.index = 0
+        return bool(self.files)
+
+    def read(self, out=None):
+        while self.index < len(self.files):
+            frame = cv2.imread(os.path.join(self.path, self.files[self.index]))
+            self.timestamp = self.index / self.fps
+            self.index += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+
+class SyntheticSource(FrameSource):
+    """Generated frames for benchmarks: a textured background with a moving,
+    then still, then absent bright block, so every detection path gets exercised."""
+
+    def __init__(self, frames=300, width=640, height=480, fps=30.0, seed=0):
+        super().__init__()
+        self.frames = frames
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.name = f"synthetic {width}x{height}"
+        rng = np.random.default_rng(seed)
+        self.background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+        self.index = 0
+
+    def open(self):
+        self.index = 0
+        return True
+
+    def read(self, out=None):
+        if self.index >= self.frames:
+            return False, None
+        if out is None or out.shape != self.background.shape:
+            out = np.empty_like(self.background)
+        np.copyto(out, self.background)
+        phase = 3 * self.index // self.frames
+        if phase < 2:
+            offset = (self.index * 4) % (self.width // 2) if phase == 0 else 0
+            x, y = self.width // 4 + offset, self.height // 4
+            cv2.rectangle(out, (x, y), (x + self.width // 5, y + self.height // 3), (200, 180, 160), -1)
+        self.timestamp = self.index / self.fps
+        self.index += 1
+        return True, out
+
+
+def open_frame_source(spec, fps=None):
+    """Build a FrameSource from "webcam[:N]", "synthetic[:FRAMES]", an image directory or a video file."""
+    kind, _, arg = spec.partition(":")
+    if kind == "webcam":
+        return WebcamSource(int(arg or 0))
+    if kind == "synthetic":
+        return SyntheticSource(int(arg or 300), fps=fps or 30.0)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, fps=fps or 10.0)
+    return VideoFileSource(spec)
+
+
+# -------------------- Frame Capture --------------------
+class FrameRingBuffer:
+    """Fixed-size ring of captured frames. Readers always get the newest one."""
+
+    def __init__(self, size=2):
+        # At least two slots so the writer never fills the slot being copied out
+        self.size = max(2, int(size))
+        self._frames = [None] * self.size
+        self._times = [0.0] * self.size
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def next_slot(self):
+        """Return the array the next frame should be read into (None until first use)."""
+        return self._frames[self._seq % self.size]
+
+    def put(self, frame, timestamp):
+        with self._cond:
+            idx = self._seq % self.size
+            self._frames[idx] = frame
+            self._times[idx] = timestamp
+            self._seq += 1
+            self._cond.notify_all()
+
+    def latest(self, last_seq=0, timeout=None, out=None):
+        """Wait for a frame newer than last_seq and return (frame, timestamp, seq).
+
+        The frame is copied into out (allocated when missing or mis-sized) since
+        the slot itself is reused by the writer. Frames captured in between are
+        skipped and counted in self.dropped. Returns (None, 0.0, last_seq) on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq, timeout):
+                return None, 0.0, last_seq
+            if last_seq:
+                self.dropped += self._seq - last_seq - 1
+            idx = (self._seq - 1) % self.size
+            frame = self._frames[idx]
+            if out is None or out.shape != frame.shape:
+                out = np.empty_like(frame)
+            np.copyto(out, frame)
+            return out, self._times[idx], self._seq
+
+
+class CaptureThread(threading.Thread):
+    """Keeps draining the camera so the driver never hands us a stale frame."""
+
+    def __init__(self, source, frames, retry_interval=0.5, metrics=None, on_frame=None):
+        super().__init__()
+        self.source = source
+        self.frames = frames
+        self.metrics = metrics
+        self.on_frame = on_frame  # Called with (frame, timestamp) before the frame is published
+        self.retry_interval = retry_interval
+        self.running = False
+        self.read_failures = 0
+        self.daemon = True
+
+    def run(self):
+        self.running = True
+        while self.running:
+            start = time.perf_counter()
+            ret, frame = self.source.read(self.frames.next_slot())
+            if self.metrics is not None:
+                self.metrics.observe("capture", time.perf_counter() - start)
+            if not ret:
+                self.read_failures += 1
+                log_event(f"Error: Could not read frame from {self.source.name}", "debug")
+                time.sleep(self.retry_interval)
+                continue
+            now = time.monotonic()
+            if self.on_frame is not None:
+                self.on_frame(frame, now)
+            self.frames.put(frame, now)
+        self.source.release()
+
+    def stop(self):
+        self.running = False
+
+
+# -------------------- Frame Pipeline --------------------
+class FramePipeline:
+    """Reusable per-frame image buffers.
+
+    Each frame is downscaled once to the detector's input size. The grayscale
+    image used by the motion gate and tracker is derived from that copy, and
+    every destination buffer is allocated once. The preview window renders
+    from the same copy in PreviewRenderer.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.small = None
+        self.gray = None
+        self.scale = (1.0, 1.0)  # Frame pixels per small-image pixel
+        self._gray_ready = False
+
+    def process(self, frame, input_size):
+        (h, w) = frame.shape[:2]
+        if self.small is None or self.small.shape[1::-1] != tuple(input_size):
+            self.small = np.empty((input_size[1], input_size[0], 3), dtype=np.uint8)
+            self.gray = np.empty((input_size[1], input_size[0]), dtype=np.uint8)
+        cv2.resize(frame, tuple(input_size), dst=self.small, interpolation=cv2.INTER_AREA)
+        self.frame = frame
+        self.scale = (w / input_size[0], h / input_size[1])
+        self._gray_ready = False
+        return self.small
+
+    def grayscale(self):
+        if not self._gray_ready:
+            cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+            self._gray_ready = True
+        return self.gray
+
+
+# -------------------- Preview --------------------
+preview_visible = True  # False while the main window is withdrawn to the tray or minimized
+
+
+class PreviewRenderer(threading.Thread):
+    """Shows the newest frame and its face boxes in the preview window from its own thread.
+
+    The monitor hands frames over with publish(); the window is refreshed at
+    most max_fps times a second and only with the latest frame. While hidden,
+    publish() returns straight away and the thread sleeps, so no copy,
+    resize, drawing or window work is done at all.
+    """
+
+    window = "Face Monitor Preview"
+
+    def __init__(self, preview_size=300, max_fps=10.0, on_escape=None, visible=True, display=True):
+        super().__init__(daemon=True)
+        self.preview_size = preview_size
+        self.max_fps = max_fps
+        self.on_escape = on_escape
+        self.visible = visible
+        self.display = display
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.image = None  # Copy of the latest published detector-sized image
+        self.faces = []
+        self.scale = (1.0, 1.0)
+        self.seq = 0
+        self.shown_seq = 0
+        self.preview = None
+        self.window_open = False
+        self.running = False
+        self.published = 0
+        self.rendered = 0
+        self.render_time = 0.0
+
+    def publish(self, image, faces, scale):
+        if not self.visible:
+            return
+        with self.lock:
+            if self.image is None or self.image.shape != image.shape:
+                self.image = np.empty_like(image)
+            np.copyto(self.image, image)
+            self.faces = faces
+            self.scale = scale
+            self.seq += 1
+        self.published += 1
+        self.wake.set()
+
+    def set_visible(self, visible):
+        self.visible = visible
+        self.wake.set()
+
+    def run(self):
+        self.running = True
+        while self.running:
+            if not self.visible:
+                if self.window_open:
+                    self.close_window()
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            start = time.perf_counter()
+            if self.seq != self.shown_seq:
+                self.render()
+            if self.window_open:
+                self.poll_window()
+            # Cap the refresh rate, then wait for a newer frame while still polling the window
+            time.sleep(max(0.0, 1.0 / self.max_fps - (time.perf_counter() - start)))
+            self.wake.clear()
+            if self.seq == self.shown_seq and self.running:
+                self.wake.wait(1.0 / self.max_fps)
+        if self.window_open:
+            self.close_window()
+
+    def render(self):
+        start = time.perf_counter()
+        size = self.preview_size
+        if self.preview is None or self.preview.shape[0] != size:
+            self.preview = np.empty((size, size, 3), dtype=np.uint8)
+        with self.lock:
+            cv2.resize(self.image, (size, size), dst=self.preview)
+            (h, w) = self.image.shape[:2]
+            faces, scale = self.faces, self.scale
+            self.shown_seq = self.seq
+        # Face boxes are in frame pixels; frame size is image size times scale
+        fx, fy = size / (w * scale[0]), size / (h * scale[1])
+        for (x, y, bw, bh) in faces:
+            cv2.rectangle(self.preview, (int(x * fx), int(y * fy)), (int((x + bw) * fx), int((y + bh) * fy)),
+                          (0, 255, 0), 2)
+        if self.display:
+            try:
+                cv2.imshow(self.window, self.preview)
+                if not self.window_open:
+                    cv2.setWindowProperty(self.window, cv2.WND_PROP_TOPMOST, 1)
+                    self.window_open = True
+            except Exception as e:
+                log_event(f"Error displaying preview: {e}. Preview disabled.", "error")
+                self.display = False
+        self.rendered += 1
+        self.render_time += time.perf_counter() - start
+
+    def poll_window(self):
+        key = cv2.waitKey(1) & 0xFF
+        if key == 27 and self.on_escape is not None:  # ESC
+            self.on_escape()
+        elif cv2.getWindowProperty(self.window, cv2.WND_PROP_VISIBLE) < 1:
+            self.window_open = False
+            self.visible = False
+            log_event("Preview window closed; it reopens when the main window is shown again.")
+
+    def close_window(self):
+        try:
+            cv2.destroyWindow(self.window)
+            cv2.waitKey(1)
+        except Exception:
+            pass
+        self.window_open = False
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+
+def set_preview_visible(visible):
+    """Show or hide the preview of the running monitor, and of monitors started later."""
+    global preview_visible
+    preview_visible = visible
+    if "monitor" in globals() and getattr(monitor, "preview", None) is not None:
+        monitor.preview.set_visible(visible)
+
+
+# -------------------- Face Detectors --------------------
+MODEL_BASE_URL = "https://github.com/opencv/opencv_3rdparty/raw/dnn_samples_face_detector_20170830/"
+YUNET_BASE_URL = "https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/"
+SFACE_BASE_URL = "https://github.com/opencv/opencv_zoo/raw/main/models/face_recognition_sface/"
+
+
+def non_max_suppression(boxes, scores, threshold):
+    """NMS over (x1, y1, x2, y2) boxes via cv2.dnn.NMSBoxes. Returns indices of kept boxes, best first."""
+    rects = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2])).tolist()
+    keep = cv2.dnn.NMSBoxes(rects, np.asarray(scores, dtype=np.float32).tolist(), 0.0, threshold)
+    return np.array(keep, dtype=np.intp).reshape(-1)
+
+
+def postprocess_ssd(detections, w, h, confidence=0.5, nms_threshold=0.3):
+    """Turn a (1, 1, N, 7) SSD output into a list of (x, y, w, h) face boxes.
+
+    Thresholding, scaling and clipping are done on all rows at once, then
+    overlapping boxes are merged with NMS so one face is never counted twice.
+    """
+    rows = detections[0, 0]
+    rows = rows[rows[:, 2] > confidence]
+    if not len(rows):
+        return []
+    boxes = rows[:, 3:7] * np.array([w, h, w, h], dtype=np.float32)
+    np.clip(boxes, 0, [w, h, w, h], out=boxes)
+    boxes = boxes.astype(np.int32)
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    boxes, scores = boxes[valid], rows[valid, 2]
+    if nms_threshold and len(boxes) > 1:
+        boxes = boxes[non_max_suppression(boxes, scores, nms_threshold)]
+    boxes[:, 2:] -= boxes[:, :2]
+    return [tuple(box) for box in boxes.tolist()]
+
+
+class FaceDetector:
+    """Base class for detector backends.
+
+    Subclasses implement load() and _detect(image, w, h), where image is the
+    frame already downscaled to input_size(w, h) and the result is a list of
+    (x, y, w, h) boxes in original frame coordinates. detect() adds per-call
+    timing. Backends that also find facial landmarks leave one row per face
+    in self.landmarks (and per image in self.batch_landmarks after
+    detect_batch()), in the layout FaceRecognizerSF.alignCrop() expects.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.total_time = 0.0
+        self.last_latency = 0.0
+        self.load_time = 0.0
+        self.stage_times = {}  # Breakdown of the last call, e.g. blob/forward/postprocess
+        self.landmarks = None
+        self.batch_landmarks = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def input_size(self, w, h):
+        """Size the frame is downscaled to before detection; keeps the aspect ratio by default."""
+        return (320, max(1, round(h * 320 / w)))
+
+    def _detect(self, image, w, h):
+        raise NotImplementedError
+
+    def detect(self, frame, image=None):
+        """Detect faces in frame, optionally using an already downscaled copy of it."""
+        (h, w) = frame.shape[:2]
+        if image is None:
+            image = cv2.resize(frame, self.input_size(w, h), interpolation=cv2.INTER_AREA)
+        return self.detect_image(image, w, h)
+
+    def detect_image(self, image, w, h):
+        """Detect faces in an image already at input_size(w, h) of a w x h frame."""
+        with self.lock:
+            start = time.perf_counter()
+            faces = self._detect(image, w, h)
+            self.record(time.perf_counter() - start, self.stage_times)
+        return faces
+
+    def detect_batch(self, images, sizes):
+        """Detect faces in several downscaled images; sizes holds each original (w, h)."""
+        results, landmarks = [], []
+        for image, (w, h) in zip(images, sizes):
+            results.append(self.detect_image(image, w, h))
+            landmarks.append(self.landmarks)
+        self.batch_landmarks = landmarks
+        return results
+
+    def record(self, latency, stage_times):
+        self.last_latency = latency
+        self.stage_times = stage_times
+        self.calls += 1
+        self.total_time += latency
+
+    def configure(self, confidence, nms_threshold):
+        self.confidence = confidence
+        self.nms_threshold = nms_threshold
+
+    def warmup(self):
+        self.detect(np.zeros((480, 640, 3), dtype=np.uint8))
+        self.calls = 0
+        self.total_time = 0.0
+
+    @property
+    def avg_latency(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class CaffeSSDDetector(FaceDetector):
+    name = "caffe_ssd"
+    model_file = "res10_300x300_ssd_iter_140000.caffemodel"
+    config_file = "deploy.prototxt"
+    dump_dir = None  # When set, every single-image net.forward() output is saved there as .npy
+
+    def __init__(self, confidence=0.5, nms_threshold=0.3):
+        super().__init__()
+        self.confidence = confidence
+        self.nms_threshold = nms_threshold
+        self.net = None
+        self.mean = (104.0, 177.0, 123.0, 0.0)
+        self.hwc = np.empty((300, 300, 3), dtype=np.float32)  # Mean-subtracted image before the NCHW transpose
+        self.blob = np.empty((1, 3, 300, 300), dtype=np.float32)
+        self.batch_blob = None  # Sized for the largest batch so far; smaller batches use its leading rows
+
+    def load(self):
+        if not (os.path.exists(self.model_file) and os.path.exists(self.config_file)):
+            log_event("Model files missing! Please download the model files from:")
+            log_event(MODEL_BASE_URL)
+            log_event("and place them in the same directory as this script.")
+            raise FileNotFoundError(self.model_file)
+        self.net = cv2.dnn.readNetFromCaffe(self.config_file, self.model_file)
+
+    def input_size(self, w, h):
+        return (300, 300)
+
+    def fill_blob(self, image, out=None):
+        """Write image into the reusable NCHW blob (or out, one CHW row of it); same result as
+        blobFromImage with the SSD mean.
+
+        The subtraction runs on contiguous HWC buffers: numpy would allocate a
+        cast buffer per frame to subtract from the transposed uint8 view.
+        """
+        cv2.subtract(image, self.mean, dst=self.hwc, dtype=cv2.CV_32F)
+        np.copyto(self.blob[0] if out is None else out, self.hwc.transpose(2, 0, 1))
+        return self.blob
+
+    def detect_batch(self, images, sizes):
+        """Run all images through one forward pass; SSD output rows carry their batch index."""
+        with self.lock:
+            t0 = time.perf_counter()
+            n = len(images)
+            if self.batch_blob is None or len(self.batch_blob) < n:
+                self.batch_blob = np.empty((n, 3, 300, 300), dtype=np.float32)
+            blob = self.batch_blob[:n]  # Contiguous: only the leading axis is sliced
+            for i, image in enumerate(images):
+                self.fill_blob(image, blob[i])
+            self.net.setInput(blob)
+            t1 = time.perf_counter()
+            detections = self.net.forward()
+            t2 = time.perf_counter()
+            image_ids = detections[0, 0, :, 0]
+            faces = [postprocess_ssd(detections[:, :, image_ids == i], w, h, self.confidence, self.nms_threshold)
+                     for i, (w, h) in enumerate(sizes)]
+            t3 = time.perf_counter()
+            self.record(t3 - t0, {"blob": t1 - t0, "forward": t2 - t1, "postprocess": t3 - t2})
+        return faces
+
+    def _detect(self, image, w, h):
+        t0 = time.perf_counter()
+        self.net.setInput(self.fill_blob(image))
+        t1 = time.perf_counter()
+        detections = self.net.forward()
+        t2 = time.perf_counter()
+        if self.dump_dir:
+            np.save(os.path.join(self.dump_dir, f"ssd_{self.calls:06d}.npy"), detections)
+        faces = postprocess_ssd(detections, w, h, self.confidence, self.nms_threshold)
+        self.stage_times = {"blob": t1 - t0, "forward": t2 - t1, "postprocess": time.perf_counter() - t2}
+        return faces
+
+
+class YuNetDetector(FaceDetector):
+    name = "yunet"
+    model_file = "face_detection_yunet_2023mar.onnx"
+
+    def __init__(self, confidence=0.6, nms_threshold=0.3):
+        super().__init__()
+        self.confidence = confidence
+        self.nms_threshold = nms_threshold
+        self.net = None
+        self.net_size = None
+
+    def load(self):
+        if not os.path.exists(self.model_file):
+            log_event(f"{self.model_file} missing! Download it from {YUNET_BASE_URL}")
+            raise FileNotFoundError(self.model_file)
+        self.net = cv2.FaceDetectorYN.create(self.model_file, "", (320, 320),
+                                             self.confidence, self.nms_threshold, 50)
+
+    def configure(self, confidence, nms_threshold):
+        super().configure(confidence, nms_threshold)
+        if self.net is not None:
+            self.net.setScoreThreshold(confidence)
+            self.net.setNMSThreshold(nms_threshold)
+
+    def _detect(self, image, w, h):
+        (ih, iw) = image.shape[:2]
+        if self.net_size != (iw, ih):
+            self.net.setInputSize((iw, ih))
+            self.net_size = (iw, ih)
+        start = time.perf_counter()
+        _, detections = self.net.detect(image)
+        self.stage_times = {"forward": time.perf_counter() - start}
+        if detections is None:
+            self.landmarks = []
+            return []
+        faces = []
+        # Box and the five landmarks alternate x and y; scale them all to frame coordinates
+        detections[:, 0:14:2] *= w / iw
+        detections[:, 1:14:2] *= h / ih
+        self.landmarks = list(detections)
+        for (x, y, bw, bh) in detections[:, :4].astype(int):
+            x, y = max(0, x), max(0, y)
+            faces.append((x, y, min(w, x + bw) - x, min(h, y + bh) - y))
+        return faces
+
+
+class YuNetInt8Detector(YuNetDetector):
+    """Block-quantized int8 YuNet, the cheapest DNN option on low-end CPUs."""
+
+    name = "yunet_int8"
+    model_file = "face_detection_yunet_2023mar_int8.onnx"
+
+
+class HaarDetector(FaceDetector):
+    name = "haar"
+
+    def __init__(self, min_size=(30, 30)):
+        super().__init__()
+        self.net = None
+        self.min_size = min_size  # In downscaled pixels
+        self.gray = None
+
+    def load(self):
+        self.net = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if self.net.empty():
+            raise RuntimeError("Could not load Haar cascade")
+
+    def _detect(self, image, w, h):
+        if self.gray is None or self.gray.shape != image.shape[:2]:
+            self.gray = np.empty(image.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        sx, sy = w / image.shape[1], h / image.shape[0]
+        self.stage_times = {}
+        return [(int(x * sx), int(y * sy), int(fw * sx), int(fh * sy))
+                for (x, y, fw, fh) in self.net.detectMultiScale(self.gray, 1.3, 5, minSize=self.min_size)]
+
+
+DETECTOR_BACKENDS = {
+    "caffe_ssd": CaffeSSDDetector,
+    "yunet": YuNetDetector,
+    "yunet_int8": YuNetInt8Detector,
+    "haar": HaarDetector,
+}
+
+_detector_cache = {}
+_detector_cache_lock = threading.Lock()
+
+
+def get_detector(name):
+    """Return the process-wide instance of a detector backend, loading and warming it up once."""
+    with _detector_cache_lock:
+        if name in _detector_cache:
+            return _detector_cache[name]
+        if name not in DETECTOR_BACKENDS:
+            raise ValueError(f"Unknown detector backend: {name}")
+        detector = DETECTOR_BACKENDS[name]()
+        start = time.perf_counter()
+        detector.load()
+        detector.warmup()
+        detector.load_time = time.perf_counter() - start
+        _detector_cache[name] = detector
+        log_event(f"{name} face detector loaded in {detector.load_time * 1000:.0f} ms.")
+        return detector
+
+
+def load_detector(name):
+    """Load the requested backend, falling back to the Caffe SSD and then Haar Cascade."""
+    candidates = [name] + [fallback for fallback in ("caffe_ssd", "haar") if fallback != name]
+    for candidate in candidates:
+        try:
+            return get_detector(candidate)
+        except Exception as e:
+            log_event(f"Error loading {candidate} detector: {e}. Falling back.", "warning")
+    raise RuntimeError("No face detector backend could be loaded")
+
+
+# -------------------- Detection Process --------------------
+class SharedFrameRing:
+    """Fixed-size uint8 image slots in multiprocessing shared memory, exposed as numpy views."""
+
+    def __init__(self, slots, shape, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        size = slots * int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self, unlink=False):
+        self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _detection_worker(detector_name, confidence, nms_threshold, requests, results):
+    """Entry point of the detection process: detects faces in shared-memory slots on request."""
+    try:
+        detector = load_detector(detector_name)
+    except RuntimeError as e:
+        results.put(("error", str(e)))
+        return
+    detector.configure(confidence, nms_threshold)
+    results.put(("ready", detector.name))
+
+    ring = None
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        if message[0] == "attach":
+            if ring is not None:
+                ring.close()
+            ring = SharedFrameRing(message[2], message[3], name=message[1])
+        elif message[0] == "configure":
+            detector.configure(message[1], message[2])
+        elif message[0] == "detect":
+            _, slot, seq, w, h = message
+            try:
+                faces = detector.detect_image(ring.frames[slot], w, h)
+            except Exception as e:
+                log_event(f"Error in {detector.name} detection: {e}", "error")
+                faces = []
+            results.put(("faces", seq, faces, detector.last_latency, detector.stage_times))
+    if ring is not None:
+        ring.close()
+
+
+class DetectionProcess:
+    """Runs a detector backend in a separate process so inference never holds this process's GIL.
+
+    Downscaled detector inputs are copied into a ring of shared-memory slots
+    and only (slot, seq) travels over the request queue; face lists come
+    back over the result queue.
+    """
+
+    def __init__(self, detector_name, confidence=0.5, nms_threshold=0.3, slots=4):
+        self.detector_name = detector_name
+        self.confidence = confidence
+        self.nms_threshold = nms_threshold
+        self.slots = slots
+        ctx = multiprocessing.get_context("spawn")
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_detection_worker, daemon=True,
+                                   args=(detector_name, confidence, nms_threshold, self.requests, self.results))
+        self.ring = None
+        self.seq = 0
+        self.in_flight = {}
+        self.last_latency = 0.0
+        self.stage_times = {}
+
+    def start(self, timeout=60.0):
+        """Start the worker and wait for its detector to load. Returns the backend name it loaded."""
+        self.process.start()
+        message = self.results.get(timeout=timeout)
+        if message[0] != "ready":
+            raise RuntimeError(message[1])
+        return message[1]
+
+    def configure(self, confidence, nms_threshold):
+        self.requests.put(("configure", confidence, nms_threshold))
+
+    def _attach(self, shape):
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+        self.ring = SharedFrameRing(self.slots, shape)
+        self.requests.put(("attach", self.ring.name, self.slots, self.ring.shape))
+
+    def submit(self, image, w, h):
+        """Copy image into a free slot and queue it for detection. Returns the request's seq."""
+        if self.ring is None or self.ring.shape != image.shape:
+            while self.in_flight:
+                self.collect(min(self.in_flight))
+            self._attach(image.shape)
+        while len(self.in_flight) >= self.slots:
+            self.collect(min(self.in_flight))
+        slot = self.seq % self.slots
+        np.copyto(self.ring.frames[slot], image)
+        self.seq += 1
+        self.in_flight[self.seq] = slot
+        self.requests.put(("detect", slot, self.seq, w, h))
+        return self.seq
+
+    def collect(self, seq, timeout=5.0):
+        """Wait for the result of request seq and return its face list.
+
+        Raises RuntimeError as soon as the worker has exited and TimeoutError
+        when it stays silent for timeout seconds. Either way the worker may
+        still own in-flight slots, so the caller must stop() this instance
+        rather than submit more frames.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                message = self.results.get(timeout=min(0.2, max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"detection process exited with code {self.process.exitcode}")
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("no result from detection process")
+                continue
+            _, done, faces, self.last_latency, self.stage_times = message
+            self.in_flight.pop(done, None)
+            if done == seq:
+                return faces
+
+    def detect(self, image, w, h):
+        return self.collect(self.submit(image, w, h))
+
+    def stop(self):
+        try:
+            self.requests.put(None)
+            self.process.join(timeout=2.0)
+        except (AssertionError, OSError):
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
+
+
+# -------------------- Motion Gate --------------------
+class MotionGate:
+    """Cheap frame-difference check that decides whether the detector needs to run.
+
+    Frames are compared as small blurred grayscale images against the frame of
+    the last confirmed frame. A full detector run is still forced every
+    force_interval seconds so a motionless scene cannot hide a change forever;
+    only confirm(detected=True) restarts that timer, so tracked frames cannot
+    postpone it.
+    """
+
+    def __init__(self, threshold=0.02, pixel_delta=25, force_interval=5.0, size=(64, 48)):
+        self.threshold = threshold  # Fraction of changed pixels that counts as motion
+        self.pixel_delta = pixel_delta
+        self.force_interval = force_interval
+        self.size = size
+        self._small = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.current = np.empty_like(self._small)
+        self.reference = np.empty_like(self._small)
+        self._diff = np.empty_like(self._small)
+        self.has_reference = False
+        self.last_detection = 0.0
+        self.last_motion = 0.0
+        self.forced = False  # The last should_detect() was due to force_interval or a missing reference
+        self.detections = 0
+        self.skipped = 0
+
+    def should_detect(self, gray, now):
+        """Compare a grayscale frame against the reference; gray may be any size."""
+        cv2.resize(gray, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(self._small, (5, 5), 0, dst=self.current)
+
+        self.forced = not self.has_reference or now - self.last_detection >= self.force_interval
+        if self.forced:
+            return True
+
+        cv2.absdiff(self.current, self.reference, dst=self._diff)
+        cv2.threshold(self._diff, self.pixel_delta, 255, cv2.THRESH_BINARY, dst=self._diff)
+        self.last_motion = cv2.countNonZero(self._diff) / self._diff.size
+        if self.last_motion > self.threshold:
+            return True
+
+        self.skipped += 1
+        return False
+
+    def confirm(self, now, detected=True):
+        """Mark the current frame as the reference for later comparisons.
+
+        detected is False when the faces came from the tracker rather than
+        the detector, which leaves the forced-detection timer running.
+        """
+        np.copyto(self.reference, self.current)
+        self.has_reference = True
+        if detected:
+            self.last_detection = now
+            self.detections += 1
+
+
+# -------------------- Face Tracker --------------------
+class FaceTracker:
+    """Follows detected face boxes with template matching between detector runs.
+
+    Matching is done on the pipeline's downscaled grayscale frame inside a
+    padded region around each box; scale is the (x, y) number of frame pixels
+    per grayscale pixel. The caller should re-run the detector when
+    needs_detection() is true or update() reports a lost track.
+    """
+
+    def __init__(self, redetect_every=10, min_confidence=0.6, padding=0.5):
+        self.redetect_every = redetect_every
+        self.min_confidence = min_confidence
+        self.padding = padding
+        self.templates = []
+        self.boxes = []
+        self.frames_since_detection = 0
+        self.confidence = 0.0
+        self.tracked = 0
+        self.lost = 0
+
+    def start(self, gray, faces, scale):
+        """Take fresh templates from a frame the detector has just processed."""
+        self.templates = []
+        self.boxes = []
+        for (x, y, w, h) in faces:
+            sx, sy = int(x / scale[0]), int(y / scale[1])
+            sw, sh = int(w / scale[0]), int(h / scale[1])
+            if sw < 4 or sh < 4:
+                continue
+            self.templates.append(gray[sy:sy + sh, sx:sx + sw].copy())
+            self.boxes.append((sx, sy, sw, sh))
+        self.frames_since_detection = 0
+        self.confidence = 1.0
+
+    def needs_detection(self):
+        return not self.templates or self.frames_since_detection >= self.redetect_every
+
+    def update(self, gray, scale):
+        """Return the tracked face list, or None when a track was lost."""
+        gh, gw = gray.shape[:2]
+        boxes = []
+        confidence = 1.0
+        for template, (x, y, w, h) in zip(self.templates, self.boxes):
+            pad_x, pad_y = int(w * self.padding), int(h * self.padding)
+            x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+            x1, y1 = min(gw, x + w + pad_x), min(gh, y + h + pad_y)
+            if x1 - x0 < w or y1 - y0 < h:
+                self.lost += 1
+                return None
+            result = cv2.matchTemplate(gray[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (mx, my) = cv2.minMaxLoc(result)
+            confidence = min(confidence, score)
+            if score < self.min_confidence:
+                self.lost += 1
+                return None
+            boxes.append((x0 + mx, y0 + my, w, h))
+
+        self.boxes = boxes
+        self.confidence = confidence
+        self.frames_since_detection += 1
+        self.tracked += 1
+        return [(int(x * scale[0]), int(y * scale[1]), int(w * scale[0]), int(h * scale[1]))
+                for (x, y, w, h) in boxes]
+
+
+# -------------------- Identity Check --------------------
+class FaceVerifier:
+    """Checks that a lone face belongs to the person enrolled at the start of the session.
+
+    Uses OpenCV's SFace recognizer. The first enroll_samples single-face
+    frames, at least a second apart, become the reference embeddings; later
+    faces are compared against all of them at once by cosine similarity.
+    An embedding is only recomputed when the face box jumps, after the face
+    was gone or when refresh_interval has passed; otherwise the last verdict
+    is reused.
+
+    With a YuNet detection row for the face, the crop is aligned on the eyes,
+    nose and mouth with alignCrop() as SFace was trained, and threshold (the
+    published 0.363) applies. Other detectors only give a box, so a square
+    crop is used and the stricter unaligned_threshold applies instead. A
+    session stays in the mode it enrolled in.
+    """
+
+    model_file = "face_recognition_sface_2021dec.onnx"
+    input_size = 112
+
+    def __init__(self, threshold=0.363, refresh_interval=10.0, jump=0.5, enroll_samples=3,
+                 unaligned_threshold=0.5):
+        self.threshold = threshold
+        self.unaligned_threshold = unaligned_threshold
+        self.refresh_interval = refresh_interval
+        self.jump = jump
+        self.enroll_samples = enroll_samples
+        self.net = None
+        self.references = None  # (n, 128) unit vectors
+        self.aligned = None  # Whether the references came from aligned crops
+        self.last_box = None
+        self.last_time = 0.0
+        self.last_match = True
+        self.similarity = 1.0
+        self.calls = 0
+        self.total_time = 0.0
+        self.started = None
+
+    def load(self):
+        if not os.path.exists(self.model_file):
+            log_event(f"{self.model_file} missing! Download it from {SFACE_BASE_URL}")
+            raise FileNotFoundError(self.model_file)
+        self.net = cv2.FaceRecognizerSF.create(self.model_file, "")
+
+    @property
+    def enrolled(self):
+        return self.references is not None and len(self.references) >= self.enroll_samples
+
+    def embed(self, frame, box, landmarks=None):
+        """Unit-length embedding of the face, aligned on its landmarks or else a square crop around box."""
+        start = time.perf_counter()
+        if landmarks is not None:
+            face = self.net.alignCrop(frame, landmarks)
+        else:
+            (x, y, w, h) = box
+            side = max(w, h)
+            cx, cy = x + w // 2, y + h // 2
+            x0, y0 = max(0, cx - side // 2), max(0, cy - side // 2)
+            crop = frame[y0:y0 + side, x0:x0 + side]
+            face = cv2.resize(crop, (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)
+        feature = self.net.feature(face).reshape(-1)
+        feature /= max(np.linalg.norm(feature), 1e-6)
+        self.calls += 1
+        self.total_time += time.perf_counter() - start
+        return feature
+
+    def needs_embedding(self, box, now):
+        if self.last_box is None:
+            return True
+        interval = 1.0 if not self.enrolled else self.refresh_interval
+        if now - self.last_time >= interval:
+            return True
+        (x, y, w, h), (lx, ly, lw, lh) = box, self.last_box
+        moved = abs((x + w / 2) - (lx + lw / 2)) + abs((y + h / 2) - (ly + lh / 2))
+        return moved > self.jump * lw or not 0.67 < w / max(lw, 1) < 1.5
+
+    def verify(self, frame, faces, now, landmarks=None):
+        """Return False when a lone face does not match the enrolled person, else True.
+
+        landmarks is the face's YuNet detection row in frame coordinates, if any.
+        """
+        if self.started is None:
+            self.started = now
+        if len(faces) != 1:
+            self.last_box = None  # Embed again when a single face reappears
+            return True
+        box = faces[0]
+        if not self.needs_embedding(box, now):
+            self.last_box = box
+            return self.last_match
+        if box[2] < 8 or box[3] < 8:
+            return self.last_match
+        aligned = landmarks is not None
+        if self.aligned is not None and aligned != self.aligned:
+            return self.last_match  # Not comparable with the references
+        feature = self.embed(frame, box, landmarks)
+        self.last_box = box
+        self.last_time = now
+        if not self.enrolled:
+            self.aligned = aligned
+            self.references = feature[None] if self.references is None else np.vstack((self.references, feature))
+            if self.enrolled:
+                log_event(f"Enrolled reference face from {len(self.references)} samples.")
+            return True
+        self.similarity = float((self.references @ feature).max())
+        self.last_match = self.similarity >= (self.threshold if self.aligned else self.unaligned_threshold)
+        return self.last_match
+
+    def summary(self, now):
+        minutes = max((now - self.started) / 60.0, 1e-6) if self.started is not None else 0.0
+        per_minute = self.calls / minutes if minutes else 0.0
+        avg = self.total_time / self.calls * 1000 if self.calls else 0.0
+        return f"Identity check: {self.calls} embeddings ({per_minute:.1f}/min), avg {avg:.1f} ms."
+
+
+# -------------------- Presence Aggregator --------------------
+class PresenceAggregator:
+    """Smooths per-frame face counts with hysteresis before PresenceMonitor acts on them.
+
+    Recent (timestamp, face_count, confidence) samples live in a fixed-size
+    numpy ring, so memory stays constant however long the session runs.
+    Confidence-weighted totals for the three count classes (no face, one
+    face, several faces) are updated as samples enter and leave the window,
+    which keeps each update O(1). The current class is kept while its share
+    of the window is at least exit_share; a new class takes over once its
+    share reaches enter_share. Samples older than max_age also leave the
+    window so a slow check rate cannot hold on to a stale state.
+
+    last_face is the time of the newest raw single-face sample. PresenceMonitor
+    times an absence from it rather than from when the smoothed count gave
+    up the face, so smoothing does not push the warning and lock back.
+    """
+
+    def __init__(self, window=5, enter_share=0.6, exit_share=0.4, max_age=10.0):
+        self.enter_share = enter_share
+        self.exit_share = exit_share
+        self.max_age = max_age
+        self.resize(window)
+
+    @staticmethod
+    def max_age_for(window, interval):
+        """max_age that keeps a full window at checks every interval seconds.
+
+        The oldest sample of a full window is (window - 1) intervals old; the
+        rest is slack for detection time and scheduler jitter.
+        """
+        return 1.5 * window * interval
+
+    def resize(self, window):
+        self.samples = np.zeros((max(1, window), 3), dtype=np.float64)  # timestamp, face count, confidence
+        self.head = 0  # Next slot to write
+        self.size = 0
+        self.weights = np.zeros(3, dtype=np.float64)  # Confidence per class: none, one, several
+        self.current = None
+        self.count = 0  # Face count reported for the current class
+        self.last_face = None
+
+    @staticmethod
+    def face_class(face_count):
+        return 0 if face_count <= 0 else 1 if face_count == 1 else 2
+
+    def _evict_oldest(self):
+        tail = (self.head - self.size) % len(self.samples)
+        _, count, confidence = self.samples[tail]
+        self.weights[self.face_class(count)] -= confidence
+        self.size -= 1
+
+    def update(self, now, face_count, confidence=1.0):
+        """Add a sample and return the smoothed face count."""
+        capacity = len(self.samples)
+        if self.size == capacity:
+            self._evict_oldest()
+        while self.size and self.samples[(self.head - self.size) % capacity, 0] < now - self.max_age:
+            self._evict_oldest()
+        confidence = max(confidence, 1e-3)
+        self.samples[self.head] = (now, face_count, confidence)
+        self.head = (self.head + 1) % capacity
+        self.size += 1
+        new_class = self.face_class(face_count)
+        self.weights[new_class] += confidence
+        if new_class == 1:
+            self.last_face = now
+
+        total = self.weights.sum()
+        if self.current is None:
+            self.current = new_class
+        elif self.weights[self.current] < self.exit_share * total:
+            best = int(self.weights.argmax())
+            if self.weights[best] >= self.enter_share * total:
+                self.current = best
+        if new_class == self.current:
+            self.count = face_count
+        elif self.face_class(self.count) != self.current:
+            self.count = self.current  # Switched on older samples: report the class's minimum count
+        return self.count
+
+
+# -------------------- Presence Logic --------------------
+class PresenceMonitor:
+    """Turns per-frame face counts into presence states and warn/lock actions.
+
+    Keeps no reference to the GUI so the same rules can drive the desktop
+    monitor and headless replays. update() returns the state for the frame
+    and a list of actions for the caller to carry out. same_person=False
+    (from FaceVerifier) turns a lone face into the different_person state.
+    face_seen_at is when a face was really last seen, for smoothed counts
+    that lag behind the camera; absences are timed from it.
+    Actions:
+    ("status", text, color), ("notify", title, message), ("beep",), ("lock",).
+    """
+
+    STATES = ("one_face", "no_face", "multiple_faces", "different_person", "locked")
+
+    def __init__(self, timeout, sensitivity, enable_notifications=True, enable_sound=True, now=0.0):
+        self.timeout = timeout
+        self.sensitivity = sensitivity
+        self.enable_notifications = enable_notifications
+        self.enable_sound = enable_sound
+        self.last_face_time = now
+        self.warning_shown = False
+        self.multiple_faces_warning_shown = False
+        self.different_person_warning_shown = False
+        self.state = None
+
+    def update(self, face_count, now, same_person=True, face_seen_at=None):
+        actions = []
+        seen = now if face_seen_at is None else face_seen_at
+        if face_count == 1 and not same_person:  # One face, but not the enrolled person
+            state = "different_person"
+            self.last_face_time = seen
+            self.warning_shown = False
+            if not self.different_person_warning_shown and self.enable_notifications:
+                actions.append(("notify", "Warning",
+                                "A different person is in front of the camera."))
+                self.different_person_warning_shown = True
+            actions.append(("status", "Status: Warning - Different person detected", "orange"))
+
+        elif face_count == 1:  # Exactly one face detected
+            state = "one_face"
+            self.last_face_time = seen
+            self.warning_shown = False
+            self.multiple_faces_warning_shown = False
+            self.different_person_warning_shown = False
+            actions.append(("status", "Status: One face detected", "green"))
+
+        elif face_count > 1:  # More than one face detected
+            state = "multiple_faces"
+            if not self.multiple_faces_warning_shown and self.enable_notifications:
+                actions.append(("notify", "Warning",
+                                "Multiple faces detected! Only one person should be in front of the camera."))
+                self.multiple_faces_warning_shown = True
+                actions.append(("status", "Status: Warning - Multiple faces detected", "orange"))
+
+        else:  # No faces detected
+            state = "no_face"
+            elapsed = now - self.last_face_time
+            if elapsed >= self.timeout - self.sensitivity and not self.warning_shown and self.enable_notifications:
+                actions.append(("notify", "Warning", "No face detected. Locking soon..."))
+                self.warning_shown = True
+                actions.append(("status", f"Status: Warning - No face detected ({int(elapsed)}s)", "orange"))
+
+            if elapsed >= self.timeout:
+                state = "locked"
+                if self.enable_notifications:
+                    actions.append(("notify", "Locking", "No face detected. Locking now."))
+                if self.enable_sound:
+                    actions.append(("beep",))
+                actions.append(("lock",))
+                self.last_face_time = now
+                self.warning_shown = False
+                actions.append(("status", "Status: Locked screen", "red"))
+            else:
+                actions.append(("status", f"Status: No face detected ({int(elapsed)}s)", "red"))
+
+        self.state = state
+        return state, actions
+
+
+# -------------------- Evidence Buffer --------------------
+class EvidenceRecorder:
+    """Keeps the last few seconds of frames as small JPEGs and saves a clip around violations.
+
+    add() is fed every captured frame and only downscales one every 1/fps
+    seconds, so clips keep their frame rate however rarely detection runs.
+    JPEG encoding, the ring itself and clip writing all live on a single
+    background worker, so the ring needs no lock and neither capture nor
+    detection waits on disk. The ring is bounded both
+    by pre_roll seconds and by memory_cap bytes of encoded data. A clip is a
+    directory of numbered JPEGs plus clip.json, which --benchmark can replay.
+    """
+
+    width = 320
+    quality = 70
+    max_backlog = 4  # Sampled frames waiting for the encoder before new ones are skipped
+
+    def __init__(self, directory="evidence", memory_cap=16 * 1024 * 1024, pre_roll=10.0, post_roll=3.0,
+                 fps=5.0, label="webcam"):
+        self.directory = directory
+        self.memory_cap = memory_cap
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.label = "".join(c if c.isalnum() else "_" for c in label)
+        self.pool = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="evidence")
+        self.ring = collections.deque()  # (timestamp, jpeg bytes); touched only by the worker
+        self.ring_bytes = 0
+        self.clip = None
+        self.last_sample = None
+        self.backlog = threading.BoundedSemaphore(self.max_backlog)  # Released by the worker
+        self.skipped = 0
+        self.clips_saved = 0
+
+    def add(self, frame, now):
+        if self.last_sample is not None and now - self.last_sample < 1.0 / self.fps:
+            return
+        if not self.backlog.acquire(blocking=False):
+            self.skipped += 1
+            return
+        self.last_sample = now
+        (h, w) = frame.shape[:2]
+        size = (self.width, max(1, h * self.width // w)) if w > self.width else (w, h)
+        try:
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            self.pool.submit(self._encode, small, now)
+        except Exception:
+            self.backlog.release()
+            raise
+
+    def trigger(self, reason, now):
+        """Start a clip: the buffered pre-roll plus post_roll seconds after now."""
+        self.pool.submit(self._trigger, reason, now)
+
+    def _encode(self, small, now):
+        try:
+            ok, jpeg = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                return
+            data = jpeg.tobytes()
+            self.ring.append((now, data))
+            self.ring_bytes += len(data)
+            while self.ring and (self.ring_bytes > self.memory_cap or now - self.ring[0][0] > self.pre_roll):
+                self.ring_bytes -= len(self.ring.popleft()[1])
+            if self.clip is not None:
+                self.clip["frames"].append((now, data))
+                if now >= self.clip["end"]:
+                    self._write(self.clip)
+                    self.clip = None
+        except Exception as e:
+            log_event(f"Error buffering evidence frame: {e}", "error")
+        finally:
+            self.backlog.release()
+
+    def _trigger(self, reason, now):
+        if self.clip is not None:
+            # Overlapping events extend the clip that is already recording
+            self.clip["end"] = max(self.clip["end"], now + self.post_roll)
+            self.clip["reasons"].append(reason)
+            return
+        self.clip = {"reasons": [reason], "time": time.time(), "event": now,
+                     "end": now + self.post_roll, "frames": list(self.ring)}
+        if self.post_roll <= 0:
+            self._write(self.clip)
+            self.clip = None
+
+    def _write(self, clip):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(clip["time"]))
+        base = path = os.path.join(self.directory, f"{stamp}_{self.label}_{clip['reasons'][0]}")
+        suffix = 1
+        while os.path.exists(path):
+            suffix += 1
+            path = f"{base}_{suffix}"
+        try:
+            os.makedirs(path, exist_ok=True)
+            for i, (_, data) in enumerate(clip["frames"]):
+                with open(os.path.join(path, f"frame_{i:05d}.jpg"), "wb") as f:
+                    f.write(data)
+            with open(os.path.join(path, "clip.json"), "w") as f:
+                json.dump({"reasons": clip["reasons"], "time": clip["time"],
+                           "frames": [round(t - clip["event"], 3) for t, _ in clip["frames"]]}, f, indent=2)
+            self.clips_saved += 1
+            log_event(f"Saved {len(clip['frames'])} evidence frames to {path}")
+        except OSError as e:
+            log_event(f"Error saving evidence clip: {e}", "error")
+
+    def close(self):
+        """Finish a clip that is still recording and wait for pending writes."""
+        def flush():
+            if self.clip is not None:
+                self._write(self.clip)
+                self.clip = None
+        self.pool.submit(flush)
+        self.pool.shutdown(wait=True)
+
+
+# -------------------- Detection Scheduler --------------------
+_cpu_times = None  # (idle, total) ticks of the previous GetSystemTimes reading
+_cpu_load_warned = False
+
+
+def _windows_cpu_times():
+    import ctypes
+    from ctypes import wintypes
+    idle, kernel, user = wintypes.FILETIME(), wintypes.FILETIME(), wintypes.FILETIME()
+    if not ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+        return None
+    ticks = [(t.dwHighDateTime << 32) | t.dwLowDateTime for t in (idle, kernel, user)]
+    return ticks[0], ticks[1] + ticks[2]  # Kernel time includes idle time
+
+
+def system_cpu_load():
+    """System-wide CPU use as a 0-1 fraction, or None when it cannot be measured.
+
+    Uses psutil when installed (optional), GetSystemTimes on Windows and the
+    1-minute load average elsewhere. psutil and GetSystemTimes measure since
+    the previous call, so the first call only starts the interval.
+    """
+    global _cpu_times, _cpu_load_warned
+    try:
+        import psutil
+        return psutil.cpu_percent(interval=None) / 100.0
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        times = _windows_cpu_times()
+        previous, _cpu_times = _cpu_times, times
+        if times is not None:
+            if previous is None or times[1] <= previous[1]:
+                return None
+            return max(0.0, 1.0 - (times[0] - previous[0]) / (times[1] - previous[1]))
+    elif hasattr(os, "getloadavg"):
+        return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+    if not _cpu_load_warned:
+        _cpu_load_warned = True
+        log_event("System CPU load cannot be measured; detection checks will not back off under load.", "warning")
+    return None
+
+
+class DetectionScheduler:
+    """Picks the pause before the next check from the presence state and system load.
+
+    Checks run at min_interval for settle seconds after any state change or
+    change in the raw face count (which smoothing may not show yet), and
+    while a missing face approaches its warning and lock deadlines. A face
+    that stays present slows checks from the base interval to max_interval
+    over stable_after seconds. Above high_load system CPU use the interval
+    grows up to threefold, except close to a deadline.
+    """
+
+    def __init__(self, base, min_interval=0.2, max_interval=3.0, high_load=0.85, stable_after=30.0, settle=3.0,
+                 log_every=60.0):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.high_load = high_load
+        self.stable_after = stable_after
+        self.settle = settle
+        self.log_every = log_every
+        self.state = None
+        self.face_count = None
+        self.last_change = 0.0
+        self.load = None
+        self.load_checked = None
+        self.window_start = None
+        self.window_checks = 0
+        self.checks = 0
+        self.started = None
+        system_cpu_load()  # Start the measurement interval so the first real reading is not 0
+
+    def next_interval(self, presence, now, face_count=None):
+        if presence.state != self.state or face_count != self.face_count:
+            self.state = presence.state
+            self.face_count = face_count
+            self.last_change = now
+        urgent = False
+        if now - self.last_change < self.settle:
+            interval, urgent = self.min_interval, True
+        elif self.state == "no_face":
+            # Sample the remaining time to the next deadline at least four times
+            elapsed = now - presence.last_face_time
+            warn_at = presence.timeout - presence.sensitivity
+            remaining = (warn_at if elapsed < warn_at else presence.timeout) - elapsed
+            interval = max(self.min_interval, min(self.base, remaining / 4))
+            urgent = interval < self.base
+        elif self.state == "one_face":
+            ramp = min(1.0, (now - self.last_change - self.settle) / self.stable_after)
+            interval = self.base + (self.max_interval - self.base) * max(0.0, ramp)
+        else:
+            interval = self.base
+
+        load = self.cpu_load(now)
+        if not urgent and load is not None and load > self.high_load:
+            interval *= 1 + 2 * (load - self.high_load) / max(1e-6, 1 - self.high_load)
+        interval = min(max(interval, self.min_interval), max(self.max_interval, self.base))
+        self.record(now)
+        return interval
+
+    def cpu_load(self, now):
+        if self.load_checked is None or now - self.load_checked >= 2.0:
+            self.load = system_cpu_load()
+            self.load_checked = now
+        return self.load
+
+    def record(self, now):
+        if self.started is None:
+            self.started = self.window_start = now
+        self.checks += 1
+        self.window_checks += 1
+        if now - self.window_start >= self.log_every:
+            rate = self.window_checks / (now - self.window_start)
+            load = f", CPU load {self.load * 100:.0f}%" if self.load is not None else ""
+            log_event(f"Detection rate {rate:.2f}/s over the last {now - self.window_start:.0f}s "
+                      f"({self.saving(rate):.0f}% below the fixed {1 / self.base:.2f}/s{load}).")
+            self.window_start = now
+            self.window_checks = 0
+
+    def saving(self, rate):
+        return max(0.0, 100 * (1 - rate * self.base))
+
+    def summary(self, now):
+        elapsed = now - self.started if self.started is not None else 0.0
+        rate = self.checks / elapsed if elapsed else 0.0
+        return (f"Adaptive checks: {self.checks} in {elapsed:.0f}s, average {rate:.2f}/s, "
+                f"{self.saving(rate):.0f}% fewer than a fixed {self.base:g}s interval.")
+
+
+# -------------------- Monitor Thread --------------------
+def monitor_options(settings):
+    """MonitorThread keyword arguments taken from a settings dict."""
+    return dict(
+        sensitivity=settings["sensitivity"],
+        timeout=settings["timeout"],
+        preview_size=settings["preview_size"],
+        check_interval=settings["check_interval"],
+        enable_notifications=settings["enable_notifications"],
+        enable_sound=settings["enable_sound"],
+        frame_buffer_size=settings["frame_buffer_size"],
+        motion_gate=settings["motion_gate"],
+        motion_threshold=settings["motion_threshold"],
+        force_detect_interval=settings["force_detect_interval"],
+        tracking=settings["tracking"],
+        redetect_every=settings["redetect_every"],
+        track_min_confidence=settings["track_min_confidence"],
+        detector=settings["detector"],
+        detection_confidence=settings["detection_confidence"],
+        nms_threshold=settings["nms_threshold"],
+        metrics_port=settings["metrics_port"],
+        metrics_snapshot_file=settings["metrics_snapshot_file"],
+        metrics_snapshot_interval=settings["metrics_snapshot_interval"],
+        notify_min_interval=settings["notify_min_interval"],
+        lock_timeout=settings["lock_timeout"],
+        detection_process=settings["detection_process"],
+        evidence_buffer=settings["evidence_buffer"],
+        evidence_dir=settings["evidence_dir"],
+        evidence_memory_mb=settings["evidence_memory_mb"],
+        evidence_pre_roll=settings["evidence_pre_roll"],
+        evidence_post_roll=settings["evidence_post_roll"],
+        evidence_fps=settings["evidence_fps"],
+        capture_negotiation=settings["capture_negotiation"],
+        identity_check=settings["identity_check"],
+        identity_threshold=settings["identity_threshold"],
+        identity_threshold_unaligned=settings["identity_threshold_unaligned"],
+        identity_refresh=settings["identity_refresh"],
+        adaptive_interval=settings["adaptive_interval"],
+        min_check_interval=settings["min_check_interval"],
+        max_check_interval=settings["max_check_interval"],
+        high_cpu_load=settings["high_cpu_load"],
+        preview_fps=settings["preview_fps"],
+        presence_smoothing=settings["presence_smoothing"],
+        smoothing_window=settings["smoothing_window"],
+        smoothing_enter=settings["smoothing_enter"],
+        smoothing_exit=settings["smoothing_exit"],
+        course_id=settings["course_id"],
+        lesson_id=settings["lesson_id"]
+    )
+
+
+class SourceChannel:
+    """Per-source half of a monitor: gates, tracks and decides on one frame source's frames.
+
+    Owns everything tied to one camera or recording (frame buffer, motion
+    gate, tracker, presence state, smoothing, identity check, evidence and
+    detection interval). The owner loads the detector, feeds frames in and
+    receives each frame's actions through on_actions(channel, state, actions, now).
+    """
+
+    OPTIONS = ("sensitivity", "timeout", "check_interval", "enable_notifications", "enable_sound",
+               "frame_buffer_size", "motion_gate", "motion_threshold", "force_detect_interval", "tracking",
+               "redetect_every", "track_min_confidence", "evidence_buffer", "evidence_dir", "evidence_memory_mb",
+               "evidence_pre_roll", "evidence_post_roll", "evidence_fps", "identity_check", "identity_threshold",
+               "identity_threshold_unaligned", "identity_refresh", "adaptive_interval", "min_check_interval", "max_check_interval",
+               "high_cpu_load", "presence_smoothing", "smoothing_window", "smoothing_enter", "smoothing_exit",
+               "course_id", "lesson_id")
+
+    def __init__(self, source, metrics, on_actions, sensitivity, timeout, check_interval,
+                 enable_notifications, enable_sound, frame_buffer_size=2, motion_gate=True, motion_threshold=0.02,
+                 force_detect_interval=5.0, tracking=True, redetect_every=10, track_min_confidence=0.6,
+                 evidence_buffer=False, evidence_dir="evidence", evidence_memory_mb=16, evidence_pre_roll=10.0,
+                 evidence_post_roll=3.0, evidence_fps=5.0, identity_check=False, identity_threshold=0.363,
+                 identity_threshold_unaligned=0.5, identity_refresh=10.0, adaptive_interval=True, min_check_interval=0.2, max_check_interval=3.0,
+                 high_cpu_load=0.85, presence_smoothing=True, smoothing_window=5, smoothing_enter=0.6,
+                 smoothing_exit=0.4, course_id="", lesson_id=""):
+        self.source = source
+        self.metrics = metrics
+        self.on_actions = on_actions
+        self.check_interval = check_interval
+        self.frames = FrameRingBuffer(frame_buffer_size)
+        self.frame_buf = None
+        self.seq = 0
+        self.capture = None
+        self.pipeline = FramePipeline()
+        self.frame_age = 0.0  # Capture-to-decision latency of the last processed frame
+        self.max_frame_age = 0.0
+        self.detector = None  # Set by the owner once loaded; only used for input sizes
+        self.motion_gate = MotionGate(motion_threshold, force_interval=force_detect_interval) if motion_gate else None
+        self.tracker = FaceTracker(redetect_every, track_min_confidence) if tracking else None
+        self.last_faces = []
+        self.detected_faces = []
+        self.landmarks = None  # Detector landmark rows for detected_faces, when the backend has them
+        self.presence = PresenceMonitor(timeout, sensitivity, enable_notifications, enable_sound, time.monotonic())
+        self.evidence = None
+        if evidence_buffer:
+            self.evidence = EvidenceRecorder(evidence_dir, evidence_memory_mb * 1024 * 1024, evidence_pre_roll,
+                                             evidence_post_roll, evidence_fps, source.name)
+        self.identity_check = identity_check
+        self.identity_threshold = identity_threshold
+        self.identity_threshold_unaligned = identity_threshold_unaligned
+        self.identity_refresh = identity_refresh
+        self.verifier = None
+        self.scheduler = None
+        if adaptive_interval:
+            self.scheduler = DetectionScheduler(check_interval, min_check_interval, max_check_interval, high_cpu_load)
+        self.aggregator = None
+        if presence_smoothing:
+            self.aggregator = PresenceAggregator(smoothing_window, smoothing_enter, smoothing_exit,
+                                                 self.smoothing_max_age(smoothing_window, adaptive_interval,
+                                                                        check_interval, max_check_interval))
+        self.frame_confidence = 1.0
+        self.session_id = uuid.uuid4().hex
+        self.course_id = course_id
+        self.lesson_id = lesson_id
+        self.face_count = 0
+
+    @staticmethod
+    def smoothing_max_age(window, adaptive_interval, check_interval, max_check_interval):
+        """Aggregator max_age for the slowest check rate the scheduler may pick."""
+        slowest = max(check_interval, max_check_interval) if adaptive_interval else check_interval
+        return PresenceAggregator.max_age_for(window, slowest)
+
+    def load_verifier(self):
+        if not self.identity_check:
+            return
+        self.verifier = FaceVerifier(self.identity_threshold, self.identity_refresh,
+                                     unaligned_threshold=self.identity_threshold_unaligned)
+        try:
+            self.verifier.load()
+        except Exception as e:
+            log_event(f"Identity check disabled: {e}", "warning")
+            self.verifier = None
+
+    def start_capture(self):
+        self.capture = CaptureThread(self.source, self.frames, metrics=self.metrics, on_frame=self.on_capture)
+        self.capture.start()
+
+    def stop_capture(self, join=True):
+        if self.capture is not None:
+            self.capture.stop()
+            if join:
+                self.capture.join(timeout=2.0)
+
+    def on_capture(self, frame, now):
+        """Capture-side tap: every frame is offered to the evidence buffer, not just decision frames."""
+        evidence = self.evidence
+        if evidence is not None:
+            evidence.add(frame, now)
+
+    def close_evidence(self):
+        if self.evidence is not None:
+            self.evidence.close()
+            self.evidence = None
+
+    def next_interval(self, now):
+        if self.scheduler is None:
+            return self.check_interval
+        interval = self.scheduler.next_interval(self.presence, now, self.face_count)
+        self.metrics.gauge("check_interval", round(interval, 3))
+        return interval
+
+    def apply_settings(self, options):
+        """Apply the per-source part of monitor_options() to a running channel."""
+        self.presence.sensitivity = options["sensitivity"]
+        self.presence.timeout = options["timeout"]
+        self.presence.enable_notifications = options["enable_notifications"]
+        self.presence.enable_sound = options["enable_sound"]
+        self.check_interval = options["check_interval"]
+        self.course_id = options["course_id"]
+        self.lesson_id = options["lesson_id"]
+
+        if not options["motion_gate"]:
+            self.motion_gate = None
+        elif self.motion_gate is None:
+            self.motion_gate = MotionGate(options["motion_threshold"], force_interval=options["force_detect_interval"])
+        else:
+            self.motion_gate.threshold = options["motion_threshold"]
+            self.motion_gate.force_interval = options["force_detect_interval"]
+
+        if not options["tracking"]:
+            self.tracker = None
+        elif self.tracker is None:
+            self.tracker = FaceTracker(options["redetect_every"], options["track_min_confidence"])
+        else:
+            self.tracker.redetect_every = options["redetect_every"]
+            self.tracker.min_confidence = options["track_min_confidence"]
+
+        max_age = self.smoothing_max_age(options["smoothing_window"], options["adaptive_interval"],
+                                         options["check_interval"], options["max_check_interval"])
+        if not options["presence_smoothing"]:
+            self.aggregator = None
+        elif self.aggregator is None or len(self.aggregator.samples) != options["smoothing_window"]:
+            self.aggregator = PresenceAggregator(options["smoothing_window"], options["smoothing_enter"],
+                                                 options["smoothing_exit"], max_age)
+        else:
+            self.aggregator.enter_share = options["smoothing_enter"]
+            self.aggregator.exit_share = options["smoothing_exit"]
+            self.aggregator.max_age = max_age
+        if not options["adaptive_interval"]:
+            self.scheduler = None
+        elif self.scheduler is None:
+            self.scheduler = DetectionScheduler(options["check_interval"], options["min_check_interval"],
+                                                options["max_check_interval"], options["high_cpu_load"])
+        else:
+            self.scheduler.base = options["check_interval"]
+            self.scheduler.min_interval = options["min_check_interval"]
+            self.scheduler.max_interval = options["max_check_interval"]
+            self.scheduler.high_load = options["high_cpu_load"]
+        if self.verifier is not None:
+            self.verifier.threshold = options["identity_threshold"]
+            self.verifier.unaligned_threshold = options["identity_threshold_unaligned"]
+            self.verifier.refresh_interval = options["identity_refresh"]
+        if self.evidence is not None:
+            self.evidence.memory_cap = options["evidence_memory_mb"] * 1024 * 1024
+            self.evidence.pre_roll = options["evidence_pre_roll"]
+            self.evidence.post_roll = options["evidence_post_roll"]
+            self.evidence.fps = options["evidence_fps"]
+
+    def prepare_frame(self, frame, now):
+        """Downscale a frame and try the cheap paths first.
+
+        Returns (faces, small): faces is None when the detector has to run
+        on small, after which record_detection() must be called.
+        """
+        metrics = self.metrics
+        (frame_h, frame_w) = frame.shape[:2]
+        t = time.perf_counter()
+        small = self.pipeline.process(frame, self.detector.input_size(frame_w, frame_h))
+        metrics.observe("resize", time.perf_counter() - t)
+
+        # Reuse the last result while the scene is static and follow known
+        # faces with the tracker between detections
+        if self.motion_gate is not None and not self.motion_gate.should_detect(self.pipeline.grayscale(), now):
+            metrics.inc("motion_skips")
+            return self.last_faces, small
+        forced = self.motion_gate is not None and self.motion_gate.forced
+        if self.tracker is not None and not forced and not self.tracker.needs_detection():
+            faces = self.tracker.update(self.pipeline.grayscale(), self.pipeline.scale)
+            if faces is not None:
+                metrics.inc("tracked_frames")
+                self.frame_confidence = self.tracker.confidence
+                self._confirm(faces, now, detected=False)
+                return faces, small
+        return None, small
+
+    def record_detection(self, faces, now, stage_times, landmarks=None):
+        self.metrics.inc("detector_runs")
+        self.frame_confidence = 1.0
+        self.detected_faces = faces
+        self.landmarks = landmarks
+        for stage, seconds in stage_times.items():
+            self.metrics.observe(stage, seconds)
+        if self.tracker is not None:
+            self.tracker.start(self.pipeline.grayscale(), faces, self.pipeline.scale)
+        self._confirm(faces, now)
+
+    def face_landmarks(self, faces):
+        """Landmark row for a lone face, moved along with the box when the tracker has shifted it."""
+        if self.landmarks is None or len(faces) != 1 or len(self.landmarks) != 1 or len(self.detected_faces) != 1:
+            return None
+        row = self.landmarks[0].copy()
+        row[0:14:2] += faces[0][0] - self.detected_faces[0][0]
+        row[1:14:2] += faces[0][1] - self.detected_faces[0][1]
+        return row
+
+    def _confirm(self, faces, now, detected=True):
+        if self.motion_gate is not None:
+            self.motion_gate.confirm(now, detected)
+        self.last_faces = faces
+
+    def complete_frame(self, faces, captured_at, now):
+        """Run the presence decision for a frame's faces and hand its actions to the owner."""
+        metrics = self.metrics
+        t = time.perf_counter()
+        self.face_count = len(faces)
+        self.frame_age = time.monotonic() - captured_at
+        self.max_frame_age = max(self.max_frame_age, self.frame_age)
+        metrics.observe("frame_age", self.frame_age)
+        metrics.inc("frames_processed")
+        metrics.set("frames_dropped", self.frames.dropped)
+        if self.capture is not None:
+            metrics.set("capture_failures", self.capture.read_failures)
+
+        same_person = True
+        if self.verifier is not None:
+            calls, start = self.verifier.calls, time.perf_counter()
+            same_person = self.verifier.verify(self.pipeline.frame, faces, now, self.face_landmarks(faces))
+            if self.verifier.calls != calls:
+                metrics.inc("embeddings")
+                metrics.observe("embed", time.perf_counter() - start)
+                metrics.gauge("identity_similarity", round(self.verifier.similarity, 3))
+
+        face_count, face_seen_at = self.face_count, None
+        if self.aggregator is not None:
+            face_count = self.aggregator.update(now, face_count, self.frame_confidence)
+            face_seen_at = self.aggregator.last_face
+
+        previous_state = self.presence.state
+        state, actions = self.presence.update(face_count, now, same_person, face_seen_at)
+        metrics.count_state(state)
+        if presence_journal is not None and state != previous_state:
+            presence_journal.record(self.session_id, state, self.face_count, self.course_id or None,
+                                    self.lesson_id or None, source=self.source.name)
+        if self.evidence is not None:
+            if state in ("multiple_faces", "different_person", "locked") and state != previous_state:
+                self.evidence.trigger(state, now)
+        self.on_actions(self, state, actions, now)
+        metrics.observe("decide", time.perf_counter() - t)
+        return state
+
+    def log_summary(self):
+        if self.motion_gate is not None:
+            checked = self.motion_gate.detections + self.motion_gate.skipped
+            log_event(f"Motion gate skipped {self.motion_gate.skipped} of {checked} detector runs.")
+        if self.tracker is not None:
+            log_event(f"Tracker covered {self.tracker.tracked} frames, lost track {self.tracker.lost} times.")
+        if self.verifier is not None:
+            log_event(self.verifier.summary(time.monotonic()))
+        if self.scheduler is not None:
+            log_event(self.scheduler.summary(time.monotonic()))
+        if self.capture is not None and self.capture.read_failures:
+            log_event(f"{self.capture.read_failures} frames could not be read from {self.source.name}.")
 
 
-# -------------------- Monitor Thread --------------------
 class MonitorThread(threading.Thread):
-    def __init__(self, sensitivity, timeout, preview_size, check_interval, enable_notifications, enable_sound):
+    def __init__(self, sensitivity, timeout, preview_size, check_interval, enable_notifications, enable_sound,
+                 frame_buffer_size=2, motion_gate=True, motion_threshold=0.02, force_detect_interval=5.0,
+                 tracking=True, redetect_every=10, track_min_confidence=0.6, detector="caffe_ssd",
+                 detection_confidence=0.5, nms_threshold=0.3,
+                 metrics_port=0, metrics_snapshot_file="", metrics_snapshot_interval=10.0,
+                 notify_min_interval=10.0, lock_timeout=5.0, detection_process=False,
+                 evidence_buffer=False, evidence_dir="evidence", evidence_memory_mb=16, evidence_pre_roll=10.0,
+                 evidence_post_roll=3.0, evidence_fps=5.0, capture_negotiation=True,
+                 identity_check=False, identity_threshold=0.363, identity_threshold_unaligned=0.5,
+                 identity_refresh=10.0, adaptive_interval=True, min_check_interval=0.2, max_check_interval=3.0,
+                 high_cpu_load=0.85, preview_fps=10.0, presence_smoothing=True, smoothing_window=5, smoothing_enter=0.6,
+                 smoothing_exit=0.4, course_id="", lesson_id="", source=None):
         super().__init__()
-        self.sensitivity = sensitivity
-        self.timeout = timeout
-        self.preview_size = preview_size
-        self.check_interval = check_interval
         self.enable_notifications = enable_notifications
-        self.enable_sound = enable_sound
         self.running = False
-        self.last_face_time = time.time()
-        self.cap = None
-        self.net = None
-        self.warning_shown = False
-        self.multiple_faces_warning_shown = False
-        self.face_count = 0
+        source = source or WebcamSource(0)
+        if capture_negotiation:
+            request_capture_profile(source, detector, check_interval)
+        self.preview_size = preview_size
+        self.preview_fps = preview_fps
+        self.preview = None
+        self.detector_name = detector
+        self.detector = None
+        self.detection_process = detection_process
+        self.remote = None
+        self.detection_confidence = detection_confidence
+        self.nms_threshold = nms_threshold
+        self.metrics = MonitorMetrics()
+        self.exporter = MetricsExporter(self.metrics, metrics_port, metrics_snapshot_file, metrics_snapshot_interval)
+        self.dispatcher = ActionDispatcher(notify_min_interval, lock_timeout, self.metrics)
+        self.channel = SourceChannel(
+            source, self.metrics, self.apply_actions, sensitivity, timeout, check_interval,
+            enable_notifications, enable_sound, frame_buffer_size=frame_buffer_size, motion_gate=motion_gate,
+            motion_threshold=motion_threshold, force_detect_interval=force_detect_interval, tracking=tracking,
+            redetect_every=redetect_every, track_min_confidence=track_min_confidence,
+            evidence_buffer=evidence_buffer, evidence_dir=evidence_dir, evidence_memory_mb=evidence_memory_mb,
+            evidence_pre_roll=evidence_pre_roll, evidence_post_roll=evidence_post_roll, evidence_fps=evidence_fps,
+            identity_check=identity_check, identity_threshold=identity_threshold,
+            identity_threshold_unaligned=identity_threshold_unaligned, identity_refresh=identity_refresh,
+            adaptive_interval=adaptive_interval, min_check_interval=min_check_interval,
+            max_check_interval=max_check_interval, high_cpu_load=high_cpu_load,
+            presence_smoothing=presence_smoothing, smoothing_window=smoothing_window,
+            smoothing_enter=smoothing_enter, smoothing_exit=smoothing_exit, course_id=course_id,
+            lesson_id=lesson_id)
+        self.pending_settings = None
         self.daemon = True
 
     def run(self):
         self.running = True
-        
-        # Try different backends to open camera
-        backends = [cv2.CAP_DSHOW, cv2.CAP_ANY]
-        for backend in backends:
-            self.cap = cv2.VideoCapture(0, backend)
-            if self.cap.isOpened():
-                break
-        
-        if not self.cap.isOpened():
-            log_event("Error: Could not open webcam")
+        channel = self.channel
+
+        if not channel.source.open():
+            log_event(f"Error: Could not open {channel.source.name}", "error")
             if self.enable_notifications:
                 notify_user("Face Monitor Error", "Could not access webcam. Please check your camera settings.")
             return
 
-        # Load DNN face detector
-        modelFile = "res10_300x300_ssd_iter_140000.caffemodel"
-        configFile = "deploy.prototxt"
-        
-        # Check if model files exist, if not, download them or use Haar Cascade
-        if not (os.path.exists(modelFile) and os.path.exists(configFile)):
-            log_event("Model files missing! Downloading...")
-            self.download_model_files()
-            
-        if os.path.exists(modelFile) and os.path.exists(configFile):
+        # Load the face detector (cached across start/stop cycles)
+        if not self.load():
+            channel.source.release()
+            return
+
+        channel.start_capture()
+        self.preview = PreviewRenderer(self.preview_size, self.preview_fps, on_escape=self.stop,
+                                       visible=preview_visible)
+        self.preview.start()
+        self.exporter.start()
+        self.dispatcher.start()
+        metrics = self.metrics
+
+        while self.running:
+            frame, captured_at, channel.seq = channel.frames.latest(channel.seq, timeout=1.0, out=channel.frame_buf)
+            if frame is None:
+                continue
+            channel.frame_buf = frame
+
+            faces = self.process_frame(frame, captured_at, time.monotonic())
+
+            t = time.perf_counter()
+            self.preview.publish(channel.pipeline.small, faces, channel.pipeline.scale)
+            metrics.observe("preview", time.perf_counter() - t)
+
+            t = time.perf_counter()
+            time.sleep(channel.next_interval(time.monotonic()))
+            metrics.observe("sleep", time.perf_counter() - t)
+
+        self.running = False
+        self.log_summary()
+        channel.stop_capture()
+        self.exporter.stop()
+        self.dispatcher.stop()
+        self.preview.stop()
+        self.preview.join(timeout=2.0)
+        channel.close_evidence()
+        self.unload()
+
+    def load(self):
+        self.channel.load_verifier()
+        if self.detection_process:
+            self.remote = DetectionProcess(self.detector_name, self.detection_confidence, self.nms_threshold)
             try:
-                self.net = cv2.dnn.readNetFromCaffe(configFile, modelFile)
-                log_event("DNN face detector loaded.")
+                name = self.remote.start()
             except Exception as e:
-                log_event(f"Error loading DNN: {e}. Falling back to Haar Cascade.")
-                self.net = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-        else:
-            log_event("Model files not available. Falling back to Haar Cascade.")
-            self.net = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+                log_event(f"Could not start detection process: {e}. Detecting in-process.", "warning")
+                self.remote.stop()
+                self.remote = None
+            else:
+                # Local, unloaded instance for input sizes and latency bookkeeping
+                self.detector = self.channel.detector = DETECTOR_BACKENDS[name]()
+                self.detector.configure(self.detection_confidence, self.nms_threshold)
+                log_event(f"{name} face detector running in process {self.remote.process.pid}.")
+                return True
+        try:
+            self.detector = self.channel.detector = load_detector(self.detector_name)
+        except RuntimeError as e:
+            log_event(f"Error: {e}")
+            return False
+        self.detector.configure(self.detection_confidence, self.nms_threshold)
+        return True
+
+    def unload(self):
+        if self.remote is not None:
+            self.remote.stop()
+            self.remote = None
+
+    def update_settings(self, settings):
+        """SettingsStore subscriber; the new values are applied by the monitor's own thread."""
+        self.pending_settings = settings
+
+    def apply_settings(self, settings):
+        """Apply changed thresholds and intervals without reopening the camera or detector."""
+        options = monitor_options(settings)
+        self.channel.apply_settings(options)
+        self.enable_notifications = options["enable_notifications"]
+        self.dispatcher.notify_min_interval = options["notify_min_interval"]
+        self.dispatcher.lock_timeout = options["lock_timeout"]
+        self.preview_size = options["preview_size"]
+        if self.preview is not None:
+            self.preview.preview_size = self.preview_size
+            self.preview.max_fps = options["preview_fps"]
+
+        self.detection_confidence = options["detection_confidence"]
+        self.nms_threshold = options["nms_threshold"]
+        if self.detector is not None:
+            self.detector.configure(self.detection_confidence, self.nms_threshold)
+        if self.remote is not None:
+            self.remote.configure(self.detection_confidence, self.nms_threshold)
+        if options["detector"] != self.detector_name:
+            log_event("Detector backend change takes effect when monitoring is restarted.")
+        log_event("Settings applied to running monitor.")
+
+    def process_frame(self, frame, captured_at, now):
+        """Detect faces in one frame and act on the presence decision. Returns the face list."""
+        if self.pending_settings is not None:
+            settings, self.pending_settings = self.pending_settings, None
+            self.apply_settings(settings)
+        faces, small = self.channel.prepare_frame(frame, now)
+        if faces is None:
+            faces = self.detect_faces(frame, small)
+            self.channel.record_detection(faces, now, self.detector.stage_times, self.detector.landmarks)
+        self.channel.complete_frame(faces, captured_at, now)
+        return faces
+
+    def apply_actions(self, channel, state, actions, now):
+        for action in actions:
+            if action[0] == "status":
+                ui_bus.publish_status(action[1], action[2])
+            else:
+                self.dispatcher.submit(action)
+
+    def detect_faces(self, frame, image=None):
+        if self.remote is not None:
+            (h, w) = frame.shape[:2]
+            if image is None:
+                image = cv2.resize(frame, self.detector.input_size(w, h), interpolation=cv2.INTER_AREA)
+            try:
+                faces = self.remote.detect(image, w, h)
+                self.detector.record(self.remote.last_latency, self.remote.stage_times)
+                return faces
+            except (RuntimeError, TimeoutError, OSError, EOFError) as e:
+                # An empty result would read as "no face" and lock the user out; detect here instead
+                log_event(f"Detection process failed: {e}. Detecting in-process from now on.", "error")
+                if not self.detect_in_process():
+                    return []
+        try:
+            return self.detector.detect(frame, image)
+        except Exception as e:
+            log_event(f"Error in {self.detector.name} detection: {e}", "error")
+            return []
 
+    def detect_in_process(self):
+        """Replace a failed detection process with an in-process detector; stops monitoring if none loads."""
+        self.unload()
+        self.metrics.inc("detection_process_failures")
+        try:
+            self.detector = self.channel.detector = load_detector(self.detector_name)
+        except RuntimeError as e:
+            log_event(f"Error: {e}. Stopping monitoring.", "error")
+            self.stop()
+            return False
+        self.detector.configure(self.detection_confidence, self.nms_threshold)
+        return True
+
+    def log_summary(self):
+        self.channel.log_summary()
+        log_event(f"Detector {self.detector.name}: {self.detector.calls} calls, "
+                  f"avg {self.detector.avg_latency * 1000:.1f} ms, last {self.detector.last_latency * 1000:.1f} ms.")
+        if event_log.suppressed:
+            counts = ", ".join(f"{count} {level}" for level, count in event_log.suppressed.items())
+            log_event(f"Suppressed log messages so far: {counts}.")
+
+    def stop(self):
+        self.running = False
+        self.channel.stop_capture(join=False)
+
+
+# -------------------- Offline Replay --------------------
+class ReplayMonitor(MonitorThread):
+    """Runs the monitor pipeline synchronously over a frame source without any GUI.
+
+    Every frame is processed (nothing is dropped) and timestamps come from the
+    source, so timeouts play out in recording time however fast the replay runs.
+    Lock/warn actions are recorded in self.timeline instead of being executed.
+    """
+
+    def __init__(self, source, **options):
+        super().__init__(source=source, **options)
+        self.timeline = []
+        self.latencies = []
+        self.presence_state = None
+
+    def apply_actions(self, channel, state, actions, now):
+        if state != self.presence_state:
+            self.timeline.append((round(now, 3), "state", state))
+            self.presence_state = state
+        for action in actions:
+            if action[0] in ("notify", "lock"):
+                self.timeline.append((round(now, 3),) + action)
+
+    def replay(self, max_frames=None):
+        if not self.channel.source.open():
+            raise RuntimeError(f"Could not open {self.channel.source.name}")
+        if not self.load():
+            raise RuntimeError("No face detector backend could be loaded")
+        channel = self.channel
+        channel.presence.last_face_time = 0.0
+        frame = None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        while max_frames is None or len(self.latencies) < max_frames:
+            ok, frame = channel.source.read(frame)
+            if not ok:
+                break
+            t = time.perf_counter()
+            channel.on_capture(frame, channel.source.timestamp)
+            self.process_frame(frame, time.monotonic(), channel.source.timestamp)
+            self.latencies.append(time.perf_counter() - t)
+        channel.source.release()
+        channel.close_evidence()
+        self.unload()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        return self.report(wall, cpu)
+
+    def report(self, wall, cpu):
+        frames = len(self.latencies)
+        latencies = np.array(self.latencies or [0.0]) * 1000
+        p50, p95, p99 = np.percentile(latencies, (50, 95, 99)).tolist()
+        return {
+            "source": self.channel.source.name,
+            "detector": self.detector.name,
+            "frames": frames,
+            "wall_seconds": wall,
+            "fps": frames / wall if wall else 0.0,
+            "latency_ms": {"p50": p50, "p95": p95, "p99": p99, "max": float(latencies.max())},
+            "cpu_percent": 100.0 * cpu / wall if wall else 0.0,
+            "detector_runs": self.metrics.counters.get("detector_runs", 0),
+            "motion_skips": self.metrics.counters.get("motion_skips", 0),
+            "tracked_frames": self.metrics.counters.get("tracked_frames", 0),
+            "states": dict(self.metrics.states),
+            "timeline": self.timeline,
+        }
+
+
+# -------------------- Multi-Source Monitor --------------------
+STATUS_SEVERITY = {"gray": 0, "green": 1, "orange": 2, "red": 3}
+
+
+class MultiSourceMonitor(threading.Thread):
+    """Watches several frame sources with one shared detector.
+
+    Every source is a SourceChannel with its own capture thread, motion
+    gate, tracker and presence state machine. Each round the frames that
+    still need the detector are stacked into a single batched forward pass.
+    """
+
+    def __init__(self, sources, batch=True, **options):
+        super().__init__()
+        self.check_interval = options["check_interval"]
+        self.detector_name = options["detector"]
+        self.detection_confidence = options["detection_confidence"]
+        self.nms_threshold = options["nms_threshold"]
+        self.batch = batch
+        self.metrics = MonitorMetrics()
+        self.exporter = MetricsExporter(self.metrics, options["metrics_port"], options["metrics_snapshot_file"],
+                                        options["metrics_snapshot_interval"])
+        self.dispatcher = ActionDispatcher(options["notify_min_interval"], options["lock_timeout"], self.metrics)
+        if options["capture_negotiation"]:
+            for source in sources:
+                request_capture_profile(source, self.detector_name, self.check_interval)
+        channel_options = {name: options[name] for name in SourceChannel.OPTIONS}
+        self.channels = [SourceChannel(source, MonitorMetrics(), self.apply_actions, **channel_options)
+                         for source in sources]
+        self.status = {channel: ("Status: Starting", "gray") for channel in self.channels}
+        self.detector = None
+        self.pending_settings = None
+        self.running = False
+        self.daemon = True
+
+    def load(self):
+        try:
+            self.detector = load_detector(self.detector_name)
+        except RuntimeError as e:
+            log_event(f"Error: {e}")
+            return False
+        self.detector.configure(self.detection_confidence, self.nms_threshold)
+        for channel in self.channels:
+            channel.detector = self.detector
+            channel.load_verifier()
+        return True
+
+    def run(self):
+        self.running = True
+        opened = []
+        for channel in self.channels:
+            if channel.source.open():
+                opened.append(channel)
+            else:
+                log_event(f"Error: Could not open {channel.source.name}", "error")
+        self.channels = opened
+        if not self.channels or not self.load():
+            for channel in self.channels:
+                channel.source.release()
+            return
+
+        for channel in self.channels:
+            channel.start_capture()
+        self.exporter.start()
+        self.dispatcher.start()
+        log_event(f"Monitoring {len(self.channels)} sources.")
+
+        started = time.perf_counter()
         while self.running:
-            ret, frame = self.cap.read()
-            if not ret:
-                log_event("Error: Could not read frame from webcam")
-                time.sleep(self.check_interval)
+            ready = []
+            for channel in self.channels:
+                frame, captured_at, channel.seq = channel.frames.latest(channel.seq, timeout=0,
+                                                                        out=channel.frame_buf)
+                if frame is not None:
+                    channel.frame_buf = frame
+                    ready.append((channel, frame, captured_at))
+            if not ready:
+                time.sleep(0.01)
                 continue
 
-            frame_resized = cv2.resize(frame, (self.preview_size, self.preview_size))
+            self.process_round(ready, time.monotonic())
+            self.publish_status()
+            elapsed = time.perf_counter() - started
+            self.metrics.gauge("throughput_fps", round(self.metrics.counters["frames_processed"] / elapsed, 2))
 
-            # Detect faces
-            faces = []
-            if isinstance(self.net, cv2.CascadeClassifier):
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.net.detectMultiScale(gray, 1.3, 5)
-            else:
-                try:
-                    (h, w) = frame.shape[:2]
-                    blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0,
-                                                 (300, 300), (104.0, 177.0, 123.0))
-                    self.net.setInput(blob)
-                    detections = self.net.forward()
-                    for i in range(0, detections.shape[2]):
-                        confidence = detections[0, 0, i, 2]
-                        if confidence > 0.5:
-                            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                            (x, y, x2, y2) = box.astype("int")
-                            # Ensure coordinates are within frame boundaries
-                            x, y = max(0, x), max(0, y)
-                            x2, y2 = min(w, x2), min(h, y2)
-                            faces.append((x, y, x2 - x, y2 - y))
-                except Exception as e:
-                    log_event(f"Error in DNN detection: {e}")
-
-            # Draw rectangles around detected faces
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame_resized, (int(x * self.preview_size / frame.shape[1]), 
-                                             int(y * self.preview_size / frame.shape[0])),
-                                             (int((x + w) * self.preview_size / frame.shape[1]), 
-                                             int((y + h) * self.preview_size / frame.shape[0])), 
-                                             (0, 255, 0), 2)
-
-            # Handle detection logic
-            self.face_count = len(faces)
-            
-            if self.face_count == 1:  # Exactly one face detected
-                self.last_face_time = time.time()
-                self.warning_shown = False
-                self.multiple_faces_warning_shown = False
-                status_label.config(text="Status: One face detected", foreground="green")
-                
-            elif self.face_count > 1:  # More than one face detected
-                if not self.multiple_faces_warning_shown and self.enable_notifications:
-                    notify_user("Warning", "Multiple faces detected! Only one person should be in front of the camera.")
-                    self.multiple_faces_warning_shown = True
-                    status_label.config(text="Status: Warning - Multiple faces detected", foreground="orange")
-                    
-            else:  # No faces detected
-                elapsed = time.time() - self.last_face_time
-                if elapsed >= self.timeout - self.sensitivity and not self.warning_shown and self.enable_notifications:
-                    notify_user("Warning", "No face detected. Locking soon...")
-                    self.warning_shown = True
-                    status_label.config(text=f"Status: Warning - No face detected ({int(elapsed)}s)", foreground="orange")
-                
-                if elapsed >= self.timeout:
-                    if self.enable_notifications:
-                        notify_user("Locking", "No face detected. Locking now.")
-                    if self.enable_sound and platform.system() == "Windows":
-                        winsound.MessageBeep(winsound.MB_ICONEXCLAMATION)
-                    lock_screen()
-                    self.last_face_time = time.time()
-                    self.warning_shown = False
-                    status_label.config(text="Status: Locked screen", foreground="red")
-                else:
-                    status_label.config(text=f"Status: No face detected ({int(elapsed)}s)", foreground="red")
+            t = time.perf_counter()
+            now = time.monotonic()
+            time.sleep(min(channel.next_interval(now) for channel in self.channels))
+            self.metrics.observe("sleep", time.perf_counter() - t)
+
+        self.log_summary(time.perf_counter() - started)
+        for channel in self.channels:
+            channel.stop_capture(join=False)
+        for channel in self.channels:
+            channel.stop_capture()
+            channel.close_evidence()
+        self.exporter.stop()
+        self.dispatcher.stop()
 
+    def process_round(self, ready, now, timestamps=None):
+        """Gate/track every frame, detect the remaining ones in one batch, then run each source's decisions."""
+        if self.pending_settings is not None:
+            settings, self.pending_settings = self.pending_settings, None
+            self.apply_settings(settings)
+        start = time.perf_counter()
+        results = []
+        pending = []
+        for channel, frame, captured_at in ready:
+            faces, small = channel.prepare_frame(frame, now)
+            results.append([channel, faces, captured_at])
+            if faces is None:
+                pending.append((len(results) - 1, frame, small))
+
+        if pending:
+            sizes = [(frame.shape[1], frame.shape[0]) for _, frame, _ in pending]
+            images = [small for _, _, small in pending]
+            batch_landmarks = [None] * len(pending)
             try:
-                cv2.imshow("Face Monitor Preview", frame_resized)
-                # Set window properties
-                cv2.setWindowProperty("Face Monitor Preview", cv2.WND_PROP_TOPMOST, 1)
+                if self.batch:
+                    batch_faces = self.detector.detect_batch(images, sizes)
+                    batch_landmarks = self.detector.batch_landmarks or batch_landmarks
+                else:
+                    batch_faces = []
+                    for i, (image, (w, h)) in enumerate(zip(images, sizes)):
+                        batch_faces.append(self.detector.detect_image(image, w, h))
+                        batch_landmarks[i] = self.detector.landmarks
             except Exception as e:
-                log_event(f"Error displaying preview: {e}")
+                log_event(f"Error in {self.detector.name} detection: {e}", "error")
+                batch_faces = [[] for _ in pending]
+                batch_landmarks = [None] * len(pending)
+            self.metrics.observe("batch", time.perf_counter() - start)
+            for stage, seconds in self.detector.stage_times.items():
+                self.metrics.observe(stage, seconds)
+            self.metrics.inc("batches")
+            self.metrics.inc("batched_frames", len(pending))
+            for (index, _, _), faces, landmarks in zip(pending, batch_faces, batch_landmarks):
+                results[index][1] = faces
+                results[index][0].record_detection(faces, now, {}, landmarks)
 
-            # Wait for key press or interval
-            key = cv2.waitKey(1) & 0xFF
-            if key == 27:  # ESC
-                break
-                
-            time.sleep(self.check_interval)
+        for i, (channel, faces, captured_at) in enumerate(results):
+            channel.complete_frame(faces, captured_at, timestamps[i] if timestamps else now)
+            self.metrics.observe(f"source{self.channels.index(channel)}_frame_age", channel.frame_age)
+        self.metrics.inc("frames_processed", len(ready))
+        self.metrics.observe("round", time.perf_counter() - start)
 
-        if self.cap:
-            self.cap.release()
-        cv2.destroyAllWindows()
+    def apply_actions(self, channel, state, actions, now):
+        for action in actions:
+            if action[0] == "status":
+                self.status[channel] = (action[1], action[2])
+                continue
+            if action[0] == "notify":
+                action = ("notify", action[1], f"{channel.source.name}: {action[2]}")
+            self.dispatcher.submit(action)
+
+    def publish_status(self):
+        text = " | ".join(f"{channel.source.name}: {self.status[channel][0].replace('Status: ', '')}"
+                          for channel in self.channels)
+        color = max((self.status[channel][1] for channel in self.channels),
+                    key=lambda c: STATUS_SEVERITY.get(c, 0))
+        ui_bus.publish_status("Status: " + text, color)
+
+    def log_summary(self, elapsed):
+        frames = self.metrics.counters.get("frames_processed", 0)
+        log_event(f"Processed {frames} frames from {len(self.channels)} sources "
+                  f"({frames / elapsed if elapsed else 0:.1f} fps aggregate).")
+        for channel in self.channels:
+            p50, p95, _ = channel.metrics.stages["frame_age"].percentiles()
+            log_event(f"{channel.source.name}: {channel.metrics.counters.get('frames_processed', 0)} frames, "
+                      f"capture-to-decision p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms.")
+
+    def update_settings(self, settings):
+        """SettingsStore subscriber; the new values are applied at the start of the next round."""
+        self.pending_settings = settings
+
+    def apply_settings(self, settings):
+        options = monitor_options(settings)
+        self.check_interval = options["check_interval"]
+        self.dispatcher.notify_min_interval = options["notify_min_interval"]
+        self.dispatcher.lock_timeout = options["lock_timeout"]
+        self.detection_confidence = options["detection_confidence"]
+        self.nms_threshold = options["nms_threshold"]
+        if self.detector is not None:
+            self.detector.configure(self.detection_confidence, self.nms_threshold)
+        for channel in self.channels:
+            channel.apply_settings(options)
 
-    def download_model_files(self):
-        # Placeholder for model download functionality
-        log_event("Please download the model files from:")
-        log_event("https://github.com/opencv/opencv_3rdparty/raw/dnn_samples_face_detector_20170830/")
-        log_event("and place them in the same directory as this script.")
-        
     def stop(self):
         self.running = False
-        if self.cap:
-            self.cap.release()
+
+    def replay(self, max_rounds=None):
+        """Process one frame from every source per round, synchronously and as fast as possible."""
+        for channel in self.channels:
+            if not channel.source.open():
+                raise RuntimeError(f"Could not open {channel.source.name}")
+        if not self.load():
+            raise RuntimeError("No face detector backend could be loaded")
+        latencies = []
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        while max_rounds is None or len(latencies) < max_rounds:
+            ready = []
+            timestamps = []
+            for channel in self.channels:
+                ok, frame = channel.source.read(channel.frame_buf)
+                if not ok:
+                    break
+                channel.frame_buf = frame
+                channel.on_capture(frame, channel.source.timestamp)
+                ready.append((channel, frame, time.monotonic()))
+                timestamps.append(channel.source.timestamp)
+            if len(ready) < len(self.channels):
+                break
+            t = time.perf_counter()
+            self.process_round(ready, timestamps[0], timestamps)
+            latencies.append(time.perf_counter() - t)
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        for channel in self.channels:
+            channel.source.release()
+            channel.close_evidence()
+        return latencies, wall, cpu
+
+
+# -------------------- Detection Server --------------------
+class MonitoringSession:
+    """Presence state of one web client session served by DetectionServer."""
+
+    def __init__(self, course_id, lesson_id, user_id, timeout, sensitivity):
+        self.id = uuid.uuid4().hex
+        self.course_id = course_id
+        self.lesson_id = lesson_id
+        self.user_id = user_id
+        self.presence = PresenceMonitor(timeout, sensitivity, enable_sound=False, now=time.monotonic())
+        self.pipeline = FramePipeline()
+        self.lock = threading.Lock()  # One frame in flight per session
+        self.status = ("Status: Waiting for frames", "gray")
+        self.state = None
+        self.face_count = 0
+        self.frames = 0
+        self.dropped = 0
+        self.events = collections.deque(maxlen=50)
+        self.started_at = time.time()
+        self.last_seen = time.monotonic()
+
+    def decide(self, faces, now):
+        self.face_count = len(faces)
+        self.frames += 1
+        self.last_seen = now
+        previous_state = self.state
+        self.state, actions = self.presence.update(self.face_count, now)
+        if presence_journal is not None and self.state != previous_state:
+            presence_journal.record(self.id, self.state, self.face_count, self.course_id, self.lesson_id,
+                                    self.user_id, "web")
+        for action in actions:
+            if action[0] == "status":
+                self.status = (action[1], action[2])
+            elif action[0] == "notify":
+                self.events.append({"time": time.time(), "type": "notify", "title": action[1], "message": action[2]})
+            else:
+                self.events.append({"time": time.time(), "type": action[0]})
+        return self.describe()
+
+    def describe(self):
+        return {
+            "sessionId": self.id,
+            "courseId": self.course_id,
+            "lessonId": self.lesson_id,
+            "userId": self.user_id,
+            "state": self.state,
+            "faceCount": self.face_count,
+            "status": self.status[0],
+            "color": self.status[1],
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "startedAt": self.started_at,
+            "idleSeconds": round(time.monotonic() - self.last_seen, 3),
+            "events": list(self.events),
+        }
+
+
+class DetectionBatcher(threading.Thread):
+    """Runs detection requests from many sessions as micro-batches.
+
+    A batch closes when max_batch requests are waiting, when every active
+    session has a frame in it, or when the oldest request has waited
+    window seconds, so a frame never waits longer than one window.
+    """
+
+    def __init__(self, detector, window=0.015, max_batch=16, expected=None, metrics=None):
+        super().__init__(daemon=True)
+        self.detector = detector
+        self.window = window
+        self.max_batch = max_batch
+        self.expected = expected or (lambda: max_batch)
+        self.metrics = metrics
+        self.requests = queue.Queue()
+
+    def detect(self, image, w, h, timeout=5.0):
+        request = [image, (w, h), threading.Event(), None]
+        self.requests.put(request)
+        if not request[2].wait(timeout):
+            raise TimeoutError("detection timed out")
+        return request[3]
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.window
+            limit = min(self.max_batch, max(1, self.expected()))
+            while len(batch) < limit:
+                try:
+                    request = self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.run_batch(batch)
+                    return
+                batch.append(request)
+            self.run_batch(batch)
+
+    def run_batch(self, batch):
+        t = time.perf_counter()
+        try:
+            results = self.detector.detect_batch([r[0] for r in batch], [r[1] for r in batch])
+        except Exception as e:
+            log_event(f"Error in {self.detector.name} detection: {e}", "error")
+            results = [[] for _ in batch]
+        if self.metrics is not None:
+            self.metrics.observe("batch", time.perf_counter() - t)
+            self.metrics.inc("batches")
+            self.metrics.inc("batched_frames", len(batch))
+            self.metrics.gauge("last_batch_size", len(batch))
+        for request, faces in zip(batch, results):
+            request[3] = faces
+            request[2].set()
+
+    def stop(self):
+        self.requests.put(None)
+
+
+def _b64url_decode(part):
+    return base64.urlsafe_b64decode(part + b"=" * (-len(part) % 4))
+
+
+def sign_token(payload, secret):
+    """HS256 JWT in the form the web API's signToken() issues."""
+    header = base64.urlsafe_b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode()).rstrip(b"=")
+    body = base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b"=")
+    signature = hmac.new(secret.encode(), header + b"." + body, hashlib.sha256).digest()
+    return b".".join((header, body, base64.urlsafe_b64encode(signature).rstrip(b"="))).decode()
+
+
+def verify_token(token, secret):
+    """Payload of an unexpired HS256 JWT signed with secret, or None."""
+    try:
+        header, body, signature = token.encode().split(b".")
+        if json.loads(_b64url_decode(header)).get("alg") != "HS256":
+            return None
+        expected = hmac.new(secret.encode(), header + b"." + body, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            return None
+        payload = json.loads(_b64url_decode(body))
+        if payload.get("exp", float("inf")) < time.time():
+            return None
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return payload
+
+
+class DetectionServer:
+    """Headless detection service behind the web client's videoMonitoringAPI.
+
+    Listens on localhost only. Besides the four session routes the client
+    already calls, POST /video/frame/<sessionId> takes a JPEG body and
+    answers with that session's status. JPEGs are decoded in a thread
+    pool and detection is micro-batched across sessions.
+
+    Browsers may only call it from allowed_origin. Every session route
+    needs the Bearer token the web API issued at login, checked against
+    jwt_secret; sessions belong to the token's user, and only STAFF_ROLES
+    may see other users' sessions. Without a jwt_secret those routes are
+    refused.
+    """
+
+    STAFF_ROLES = ("teacher", "admin")
+
+    def __init__(self, port=5055, detector="caffe_ssd", detection_confidence=0.5, nms_threshold=0.3,
+                 batch_window=0.015, max_batch=16, decode_workers=4, timeout=10, sensitivity=5,
+                 session_timeout=300, allowed_origin="http://localhost:5173", jwt_secret=""):
+        self.port = port
+        self.detector_name = detector
+        self.detection_confidence = detection_confidence
+        self.nms_threshold = nms_threshold
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.decode_workers = decode_workers
+        self.timeout = timeout
+        self.sensitivity = sensitivity
+        self.session_timeout = session_timeout
+        self.allowed_origin = allowed_origin
+        self.jwt_secret = jwt_secret
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.metrics = MonitorMetrics()
+        self.detector = None
+        self.batcher = None
+        self.decoder = None
+        self.server = None
+
+    @classmethod
+    def from_settings(cls, settings, port=None):
+        return cls(port=settings["server_port"] if port is None else port, detector=settings["detector"],
+                   detection_confidence=settings["detection_confidence"], nms_threshold=settings["nms_threshold"],
+                   batch_window=settings["server_batch_window_ms"] / 1000.0, max_batch=settings["server_max_batch"],
+                   decode_workers=settings["server_decode_workers"], timeout=settings["timeout"],
+                   sensitivity=settings["sensitivity"], session_timeout=settings["server_session_timeout"],
+                   allowed_origin=settings["server_allowed_origin"], jwt_secret=settings["server_jwt_secret"])
+
+    def start(self):
+        from http.server import ThreadingHTTPServer
+        self.detector = load_detector(self.detector_name)
+        self.detector.configure(self.detection_confidence, self.nms_threshold)
+        self.batcher = DetectionBatcher(self.detector, self.batch_window, self.max_batch,
+                                        expected=lambda: len(self.sessions), metrics=self.metrics)
+        self.batcher.start()
+        self.decoder = concurrent.futures.ThreadPoolExecutor(self.decode_workers, thread_name_prefix="decode")
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self.make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        log_event(f"Detection server listening on http://127.0.0.1:{self.port}/video "
+                  f"({self.detector.name}, batch window {self.batch_window * 1000:.0f} ms)")
+        if not self.jwt_secret:
+            log_event("server_jwt_secret is not set; session requests will be refused.", "warning")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.decoder:
+            self.decoder.shutdown(wait=False)
+        if self.batcher:
+            self.batcher.stop()
+
+    def start_session(self, course_id, lesson_id, user_id):
+        session = MonitoringSession(course_id, lesson_id, user_id, self.timeout, self.sensitivity)
+        with self.sessions_lock:
+            self.expire_sessions()
+            self.sessions[session.id] = session
+        log_event(f"Monitoring session {session.id} started for user {user_id}, lesson {lesson_id}.")
+        return session.describe()
+
+    def stop_session(self, session_id, user_id=None):
+        """Stop a session; with user_id, only one that user started."""
+        with self.sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is None or (user_id is not None and session.user_id != user_id):
+                return None
+            del self.sessions[session_id]
+        log_event(f"Monitoring session {session_id} stopped after {session.frames} frames.")
+        return session.describe()
+
+    def session_status(self, session_id, user_id=None):
+        """Status of a session; with user_id, only of one that user started."""
+        session = self.sessions.get(session_id)
+        if session is None or (user_id is not None and session.user_id != user_id):
+            return None
+        return session.describe()
+
+    def active_sessions(self, user_id=None):
+        """Every live session, or with user_id only that user's."""
+        with self.sessions_lock:
+            self.expire_sessions()
+            return [session.describe() for session in self.sessions.values()
+                    if user_id is None or session.user_id == user_id]
+
+    def expire_sessions(self):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_seen > self.session_timeout:
+                del self.sessions[session_id]
+                log_event(f"Monitoring session {session_id} expired.")
+
+    def process_frame(self, session_id, data, user_id=None):
+        """Decode a JPEG for a session, detect faces and return the session status.
+
+        Raises KeyError for unknown sessions (or, with user_id, another
+        user's) and ValueError for undecodable frames. A frame arriving while
+        the session's previous one is still being processed is dropped.
+        """
+        session = self.sessions[session_id]
+        if user_id is not None and session.user_id != user_id:
+            raise KeyError(session_id)
+        if not session.lock.acquire(blocking=False):
+            session.dropped += 1
+            self.metrics.inc("frames_dropped")
+            return dict(session.describe(), frameDropped=True)
+        try:
+            t = time.perf_counter()
+            decoded = self.decoder.submit(self.decode, session, data).result()
+            if decoded is None:
+                raise ValueError("could not decode frame")
+            self.metrics.observe("decode", time.perf_counter() - t)
+            faces = self.batcher.detect(*decoded)
+            result = session.decide(faces, time.monotonic())
+            self.metrics.inc("frames_processed")
+            self.metrics.observe("request", time.perf_counter() - t)
+            return result
+        finally:
+            session.lock.release()
+
+    def decode(self, session, data):
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+        (h, w) = frame.shape[:2]
+        return session.pipeline.process(frame, self.detector.input_size(w, h)), w, h
+
+    def make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def route(self):
+                path = self.path.split("?")[0].rstrip("/")
+                if path.startswith("/api/"):
+                    path = path[4:]
+                return path
+
+            def reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.cors()
+                self.end_headers()
+                self.wfile.write(body)
+
+            def cors(self):
+                if server.allowed_origin:
+                    self.send_header("Access-Control-Allow-Origin", server.allowed_origin)
+                    self.send_header("Vary", "Origin")
+
+            def authorize(self):
+                """Token payload of the caller, or None after answering 401."""
+                header = self.headers.get("Authorization", "")
+                if not header.startswith("Bearer "):
+                    self.reply(401, {"message": "Missing token"})
+                    return None
+                payload = verify_token(header[7:], server.jwt_secret) if server.jwt_secret else None
+                if payload is None:
+                    self.reply(401, {"message": "Invalid token"})
+                return payload
+
+            def read_body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_OPTIONS(self):
+                self.send_response(204)
+                self.cors()
+                self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+                self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def owner(self, user):
+                """user_id filter for the caller's sessions; None lets staff see everyone's."""
+                return None if user.get("role") in server.STAFF_ROLES else user.get("sub")
+
+            def do_GET(self):
+                path = self.route()
+                if path.startswith("/video/"):
+                    user = self.authorize()
+                    if user is None:
+                        return
+                if path == "/video/active-sessions":
+                    self.reply(200, {"sessions": server.active_sessions(self.owner(user))})
+                elif path.startswith("/video/monitoring-status/"):
+                    status = server.session_status(path.rsplit("/", 1)[1], self.owner(user))
+                    if status is None:
+                        self.reply(404, {"message": "Session not found"})
+                    else:
+                        self.reply(200, status)
+                elif path == "/metrics":
+                    body = server.metrics.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.reply(404, {"message": "Not found"})
+
+            def do_POST(self):
+                path = self.route()
+                body = self.read_body()
+                user = self.authorize()
+                if user is None:
+                    return
+                try:
+                    if path.startswith("/video/frame/"):
+                        self.reply(200, server.process_frame(path.rsplit("/", 1)[1], body, user.get("sub")))
+                        return
+                    data = json.loads(body or b"{}")
+                    if path == "/video/start-monitoring":
+                        self.reply(201, server.start_session(data.get("courseId"), data.get("lessonId"),
+                                                             user.get("sub")))
+                    elif path == "/video/stop-monitoring":
+                        summary = server.stop_session(data.get("sessionId"), user.get("sub"))
+                        if summary is None:
+                            self.reply(404, {"message": "Session not found"})
+                        else:
+                            self.reply(200, summary)
+                    else:
+                        self.reply(404, {"message": "Not found"})
+                except KeyError:
+                    self.reply(404, {"message": "Session not found"})
+                except (ValueError, AttributeError) as e:
+                    self.reply(400, {"message": str(e)})
+                except TimeoutError as e:
+                    self.reply(503, {"message": str(e)})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def run_server(settings, port=None):
+    """Serve detection requests until interrupted."""
+    server = DetectionServer.from_settings(settings, port)
+    try:
+        server.start()
+    except (RuntimeError, OSError) as e:
+        log_event(f"Could not start detection server: {e}", "error")
+        return
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def run_benchmark(source_spec, detector=None, max_frames=None, fps=None, output=None, dump_dir=None):
+    """Replay a frame source through the full detect/decide pipeline and print a report.
+
+    With dump_dir, the raw caffe_ssd outputs are saved there for p3_bench.py --bench-postprocess.
+    """
+    settings = load_settings()
+    if detector:
+        settings["detector"] = detector
+    if dump_dir:
+        os.makedirs(dump_dir, exist_ok=True)
+        CaffeSSDDetector.dump_dir = dump_dir
+    monitor = ReplayMonitor(open_frame_source(source_spec, fps=fps), **monitor_options(settings))
+    result = monitor.replay(max_frames)
+    print(f"source:      {result['source']}")
+    print(f"detector:    {result['detector']}")
+    print(f"frames:      {result['frames']} in {result['wall_seconds']:.2f}s ({result['fps']:.1f} fps)")
+    latency = result["latency_ms"]
+    print(f"latency ms:  p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  "
+          f"p99 {latency['p99']:.2f}  max {latency['max']:.2f}")
+    print(f"cpu:         {result['cpu_percent']:.0f}%")
+    print(f"detector:    {result['detector_runs']} runs, {result['tracked_frames']} tracked, "
+          f"{result['motion_skips']} motion skips")
+    print("timeline:")
+    for event in result["timeline"]:
+        print("  " + "  ".join(str(part) for part in event))
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+# -------------------- Batch Analysis --------------------
+_analysis_worker = {}  # Per-process detector and pipeline, set up once by _init_analysis_worker
+
+
+def _init_analysis_worker(detector_name, confidence, nms_threshold):
+    detector = load_detector(detector_name)
+    detector.configure(confidence, nms_threshold)
+    _analysis_worker["detector"] = detector
+    _analysis_worker["pipeline"] = FramePipeline()
+
+
+def find_videos(paths):
+    """Video files named directly or found under directories, in a stable order."""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.extend(os.path.join(root, name) for name in files
+                              if name.lower().endswith(VideoFileSource.EXTENSIONS))
+        else:
+            videos.append(path)
+    return sorted(set(os.path.abspath(video) for video in videos))
+
+
+def plan_shards(videos, shard_seconds):
+    """Split every video into (session, path, start, end) time ranges of at most shard_seconds."""
+    shards = []
+    sessions = {}
+    for path in videos:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        session = stem if stem not in sessions.values() else f"{stem}_{len(sessions)}"
+        sessions[path] = session
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+        duration = frames / fps if fps > 0 and frames > 0 else 0.0
+        if duration <= 0:
+            shards.append((session, path, 0.0, float("inf")))  # Unknown length: one shard
+            continue
+        start = 0.0
+        while start < duration:
+            shards.append((session, path, start, min(start + shard_seconds, duration)))
+            start += shard_seconds
+    return shards
+
+
+def shard_file(output_dir, shard):
+    session, _, start, _ = shard
+    return os.path.join(output_dir, "shards", f"{session}@{start:09.1f}.csv")
+
+
+def analyze_shard(shard, output_dir, sample_fps):
+    """Count faces in one time range of a video at sample_fps and write time,faces rows.
+
+    Skipped frames are only grabbed, never decoded. The shard file appears
+    atomically when complete, which is what makes runs resumable.
+    """
+    session, path, start, end = shard
+    detector = _analysis_worker["detector"]
+    pipeline = _analysis_worker["pipeline"]
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    stride = max(1, round(fps / sample_fps))
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+    rows = []
+    frame = None
+    index = 0
+    while True:
+        if not cap.grab():
+            break
+        t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if t >= end:
+            break
+        if index % stride == 0:
+            ok, frame = cap.retrieve(frame)
+            if not ok:
+                break
+            (h, w) = frame.shape[:2]
+            small = pipeline.process(frame, detector.input_size(w, h))
+            rows.append((round(t, 3), len(detector.detect_image(small, w, h))))
+        index += 1
+    cap.release()
+
+    target = shard_file(output_dir, shard)
+    tmp = target + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("time", "faces"))
+        writer.writerows(rows)
+    os.replace(tmp, target)
+    return shard, len(rows)
+
+
+def _analyze_shard_task(args):
+    return analyze_shard(*args)
+
+
+def summarize_session(session, samples, timeout, sensitivity, sample_fps, timeline):
+    """Run PresenceMonitor over a session's samples, append state segments to timeline and return stats."""
+    presence = PresenceMonitor(timeout, sensitivity, enable_sound=False, now=samples[0][0] if samples else 0.0)
+    seconds = collections.Counter()
+    stats = {"session": session, "samples": len(samples), "locks": 0, "warnings": 0, "multiple_face_episodes": 0}
+    segment = None
+    for i, (t, faces) in enumerate(samples):
+        state, actions = presence.update(faces, t)
+        dt = samples[i + 1][0] - t if i + 1 < len(samples) else 1.0 / sample_fps
+        seconds[state] += dt
+        for action in actions:
+            if action[0] == "lock":
+                stats["locks"] += 1
+            elif action[0] == "notify":
+                stats["warnings"] += 1
+        if segment is None or segment[3] != state:
+            if state == "multiple_faces":
+                stats["multiple_face_episodes"] += 1
+            if segment is not None:
+                segment[2] = t
+                timeline.writerow(segment)
+            segment = [session, t, t, state, faces]
+        segment[4] = max(segment[4], faces)
+    if segment is not None:
+        segment[2] = round(samples[-1][0] + 1.0 / sample_fps, 3)
+        timeline.writerow(segment)
+    stats["duration"] = round(sum(seconds.values()), 3)
+    for state in PresenceMonitor.STATES:
+        stats[f"{state}_seconds"] = round(seconds[state], 3)
+    return stats
+
+
+def run_analysis(paths, output_dir, sample_fps=2.0, workers=None, shard_seconds=300.0, detector=None):
+    """Analyze recorded session videos in parallel and write timeline.csv and summary.csv to output_dir.
+
+    Videos are split into shard_seconds ranges that are counted in a
+    process pool, one detector per worker. Finished shards are kept, so an
+    interrupted run picks up where it stopped when started again with the
+    same arguments. Presence rules then run per session over the merged samples.
+    """
+    settings = load_settings()
+    if detector:
+        settings["detector"] = detector
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(os.path.join(output_dir, "shards"), exist_ok=True)
+
+    manifest = {"sample_fps": sample_fps, "shard_seconds": shard_seconds, "detector": settings["detector"],
+                "detection_confidence": settings["detection_confidence"], "nms_threshold": settings["nms_threshold"]}
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            log_event(f"{output_dir} holds results for different analysis settings {previous}; "
+                      f"use another output directory.", "error")
+            return None
+    else:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    shards = plan_shards(find_videos(paths), shard_seconds)
+    todo = [shard for shard in shards if not os.path.exists(shard_file(output_dir, shard))]
+    log_event(f"Analyzing {len(shards)} shards ({len(shards) - len(todo)} already done) with {workers} workers.")
+
+    started = time.perf_counter()
+    samples = 0
+    tasks = [(shard, output_dir, sample_fps) for shard in todo]
+    init_args = (settings["detector"], settings["detection_confidence"], settings["nms_threshold"])
+    if workers == 1 or len(todo) <= 1:
+        if todo:
+            _init_analysis_worker(*init_args)
+        results = map(_analyze_shard_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.get_context("spawn").Pool(workers, _init_analysis_worker, init_args)
+        results = pool.imap_unordered(_analyze_shard_task, tasks)
+    try:
+        for done, (shard, count) in enumerate(results, 1):
+            samples += count
+            log_event(f"[{done}/{len(todo)}] {shard[0]} {shard[2]:.0f}s: {count} samples", "debug")
+    except KeyboardInterrupt:
+        log_event("Analysis interrupted; run again with the same arguments to resume.", "warning")
+        if pool is not None:
+            pool.terminate()
+        return None
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - started
+
+    by_session = collections.defaultdict(list)
+    for shard in shards:
+        by_session[shard[0]].append(shard)
+    summaries = []
+    with open(os.path.join(output_dir, "timeline.csv"), "w", newline="") as f:
+        timeline = csv.writer(f)
+        timeline.writerow(("session", "start", "end", "state", "max_faces"))
+        for session, session_shards in by_session.items():
+            rows = []
+            for shard in sorted(session_shards, key=lambda s: s[2]):
+                with open(shard_file(output_dir, shard), newline="") as shard_f:
+                    reader = csv.reader(shard_f)
+                    next(reader)
+                    rows.extend((float(t), int(faces)) for t, faces in reader)
+            summaries.append(summarize_session(session, rows, settings["timeout"], settings["sensitivity"],
+                                               sample_fps, timeline))
+    with open(os.path.join(output_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(summaries[0]) if summaries else ["session"])
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    log_event(f"Analyzed {len(by_session)} sessions: {samples} new samples in {elapsed:.1f}s "
+              f"({samples / elapsed if elapsed else 0:.1f} samples/s). Results in {output_dir}")
+    return summaries
+
+
+# -------------------- Startup --------------------
+class StartupPrefetch:
+    """Opens the camera, loads the face detector and draws the tray icon in the
+    background while the GUI is being built.
+
+    The detector lands in the get_detector() cache that MonitorThread.load()
+    reads, and start_monitoring() picks up the opened camera with take_source().
+    """
+
+    def __init__(self, settings, tray=True):
+        self.settings = settings
+        sources = settings["sources"]
+        # Several sources are opened by MultiSourceMonitor itself
+        self.source = None if len(sources) > 1 else (open_frame_source(sources[0]) if sources else WebcamSource(0))
+        self.opened = False
+        self.source_thread = None
+        self.tray = tray
+
+    def start(self):
+        tasks = []
+        if self.source is not None:
+            tasks.append(self._open_source)
+        if not self.settings["detection_process"]:
+            tasks.append(self._load_detector)
+        if self.tray:
+            tasks.append(tray_icon_image)
+        for task in tasks:
+            thread = threading.Thread(target=self._run, args=(task,), daemon=True)
+            thread.start()
+            if task == self._open_source:
+                self.source_thread = thread
+        return self
+
+    def _run(self, task):
+        start = time.perf_counter()
+        try:
+            task()
+        except Exception as e:
+            log_event(f"Startup prefetch {task.__name__} failed: {e}", "warning")
+        else:
+            log_event(f"Startup prefetch {task.__name__} took {(time.perf_counter() - start) * 1000:.0f} ms.", "debug")
+
+    def _open_source(self):
+        if self.settings["capture_negotiation"]:
+            request_capture_profile(self.source, self.settings["detector"], self.settings["check_interval"])
+        self.opened = self.source.open()
+
+    def _load_detector(self):
+        load_detector(self.settings["detector"])
+
+    def take_source(self, timeout=10.0):
+        """The prefetched source once its open attempt finished, or None. Hands it out once."""
+        if self.source_thread is not None:
+            self.source_thread.join(timeout)
+        source, self.source = self.source, None
+        return source if self.opened else None
+
+
+startup_prefetch = None
 
 
 # -------------------- GUI Setup --------------------
@@ -348,14 +4273,15 @@ def start_monitoring():
         messagebox.showinfo("Info", "Monitoring is already running.")
         return
         
-    monitor = MonitorThread(
-        sensitivity=settings["sensitivity"],
-        timeout=settings["timeout"],
-        preview_size=settings["preview_size"],
-        check_interval=settings["check_interval"],
-        enable_notifications=settings["enable_notifications"],
-        enable_sound=settings["enable_sound"]
-    )
+    sources = settings["sources"]
+    if len(sources) > 1:
+        monitor = MultiSourceMonitor([open_frame_source(spec) for spec in sources], **monitor_options(settings))
+    else:
+        source = startup_prefetch.take_source() if startup_prefetch else None
+        if source is None and sources:
+            source = open_frame_source(sources[0])
+        monitor = MonitorThread(source=source, **monitor_options(settings))
+    settings_store.subscribe(monitor.update_settings)
     monitor.start()
     start_btn.config(state=tk.DISABLED)
     stop_btn.config(state=tk.NORMAL)
@@ -364,11 +4290,12 @@ def start_monitoring():
 
 def stop_monitoring():
     if "monitor" in globals() and monitor.is_alive():
+        settings_store.unsubscribe(monitor.update_settings)
         monitor.stop()
         monitor.join(timeout=2.0)
         start_btn.config(state=tk.NORMAL)
         stop_btn.config(state=tk.DISABLED)
-        status_label.config(text="Status: Stopped", foreground="gray")
+        ui_bus.publish_status("Status: Stopped", "gray")
         log_event("Monitoring stopped.")
 
 
@@ -383,6 +4310,7 @@ def save_current_settings():
         "check_interval": float(check_interval_var.get()),
         "show_logs": bool(show_logs_var.get())
     }
+    settings = {**load_settings(), **settings}
     save_settings(settings)
 
     if settings["autostart"]:
@@ -402,35 +4330,46 @@ def on_closing():
         root.destroy()
 
 
-def minimize_to_tray():
-    root.withdraw()
-    
-    def create_tray_icon():
-        # Create an image for the tray icon
+_tray_image = None
+
+
+def tray_icon_image():
+    """The tray icon image, drawn once per process."""
+    global _tray_image
+    if _tray_image is None:
         width = 64
         height = 64
         image = Image.new('RGB', (width, height), (0, 0, 0, 0))
         dc = ImageDraw.Draw(image)
         dc.rectangle([(width//4, height//4), (3*width//4, 3*height//4)], fill=(0, 128, 255))
         dc.ellipse([(width//3, height//3), (2*width//3, 2*height//3)], fill=(255, 255, 255))
-        
-        return image
+        _tray_image = image
+    return _tray_image
+
 
+def minimize_to_tray():
+    root.withdraw()
+    set_preview_visible(False)
+
+    # Menu callbacks run on the tray thread; hand all Tk work to the main loop
     def on_quit(icon, item):
-        stop_monitoring()
+        ui_bus.unsubscribe_status(update_title)
         icon.stop()
-        root.quit()
+        ui_bus.call(stop_monitoring)
+        ui_bus.call(root.quit)
 
     def show_window(icon, item):
+        ui_bus.unsubscribe_status(update_title)
         icon.stop()
-        root.after(0, root.deiconify)
-        root.after(0, root.lift)
+        ui_bus.call(root.deiconify)
+        ui_bus.call(root.lift)
+        ui_bus.call(set_preview_visible, True)
 
     def toggle_monitoring(icon, item):
         if "monitor" in globals() and monitor.is_alive():
-            stop_monitoring()
+            ui_bus.call(stop_monitoring)
         else:
-            start_monitoring()
+            ui_bus.call(start_monitoring)
 
     # Create menu
     monitoring_text = "Stop Monitoring" if "monitor" in globals() and monitor.is_alive() else "Start Monitoring"
@@ -440,8 +4379,12 @@ def minimize_to_tray():
         item('Quit', on_quit)
     )
     
-    image = create_tray_icon()
-    icon = Icon("Face Monitor", image, menu=menu)
+    icon = Icon("Face Monitor", tray_icon_image(), menu=menu)
+
+    def update_title(text, color):
+        icon.title = f"Face Monitor - {text}"
+
+    ui_bus.subscribe_status(update_title)
     
     def run_icon():
         icon.run()
@@ -470,6 +4413,21 @@ def create_tooltip(widget, text):
     widget.bind("<Leave>", leave)
 
 
+def update_status_label(text, color):
+    status_label.config(text=text, foreground=color)
+
+
+def write_log_lines(lines):
+    log_text.config(state=tk.NORMAL)
+    log_text.insert(tk.END, "\n".join(lines) + "\n")
+    # Keep the widget bounded to the same number of lines as the in-memory log
+    excess = int(log_text.index("end-1c").split(".")[0]) - 1 - event_log.capacity
+    if excess > 0:
+        log_text.delete("1.0", f"{excess + 1}.0")
+    log_text.yview(tk.END)
+    log_text.config(state=tk.DISABLED)
+
+
 def toggle_logs_visibility():
     settings = load_settings()
     if settings["show_logs"]:
@@ -497,6 +4455,9 @@ def create_gui():
     root.title("Face Monitor")
     root.geometry("600x650")
     root.protocol("WM_DELETE_WINDOW", on_closing)
+    # Only render the preview while the main window is on screen
+    root.bind("<Unmap>", lambda event: event.widget is root and set_preview_visible(False))
+    root.bind("<Map>", lambda event: event.widget is root and set_preview_visible(True))
 
     settings = load_settings()
 
@@ -599,6 +4560,8 @@ def create_gui():
     log_text = scrolledtext.ScrolledText(log_frame, height=10, state=tk.DISABLED)
     log_text.pack(fill=tk.BOTH, expand=True)
 
+    ui_bus.attach(root, update_status_label, write_log_lines, settings["ui_refresh_ms"])
+
     # Add some introductory text
     log_event("Face Monitor started. Configure settings and click 'Start Monitoring' to begin.")
     log_event("Note: For best results, ensure good lighting and camera positioning.")
@@ -609,13 +4572,54 @@ def create_gui():
 
 # -------------------- Entry Point --------------------
 if __name__ == "__main__":
-    hidden_mode = "--hidden" in sys.argv
-    
-    # Create the GUI first
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Face Monitor")
+    parser.add_argument("--hidden", action="store_true", help="start monitoring minimized to the tray")
+    parser.add_argument("--benchmark", metavar="SOURCE",
+                        help="replay a video file, image directory, synthetic[:FRAMES] or webcam[:N] "
+                             "through the detection pipeline headlessly and exit")
+    parser.add_argument("--detector", help="detector backend for --benchmark (default: from settings)")
+    parser.add_argument("--frames", type=int, help="stop --benchmark after this many frames")
+    parser.add_argument("--fps", type=float, help="frame rate assumed for image directories and synthetic frames")
+    parser.add_argument("--report", metavar="JSON", help="also write the --benchmark report to this file")
+    parser.add_argument("--dump-detections", metavar="DIR",
+                        help="save each caffe_ssd net.forward() output of --benchmark to DIR as .npy")
+    parser.add_argument("--analyze", nargs="+", metavar="VIDEO",
+                        help="analyze recorded videos (files or directories) in parallel and exit")
+    parser.add_argument("--out", default="analysis", help="output directory for --analyze (default: analysis)")
+    parser.add_argument("--sample-fps", type=float, default=2.0, help="frames per second sampled by --analyze")
+    parser.add_argument("--workers", type=int, help="worker processes for --analyze (default: CPU count)")
+    parser.add_argument("--shard-seconds", type=float, default=300.0,
+                        help="longest time range of one video handled by one --analyze task")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the headless detection server for the web client instead of the GUI")
+    parser.add_argument("--port", type=int, help="port for --serve (default: server_port setting)")
+    args = parser.parse_args()
+    configure_logging(load_settings())
+    settings_store.watch()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.detector, args.frames, args.fps, args.report, args.dump_detections)
+        sys.exit(0)
+    if args.analyze:
+        run_analysis(args.analyze, args.out, args.sample_fps, args.workers, args.shard_seconds, args.detector)
+        sys.exit(0)
+    if args.serve:
+        start_journal(load_settings())
+        run_server(load_settings(), args.port)
+        sys.exit(0)
+
+    start_journal(load_settings())
+    hidden_mode = args.hidden
+    if hidden_mode:
+        # Open the camera and load the model while the window is being built
+        startup_prefetch = StartupPrefetch(load_settings()).start()
+
     root = create_gui()
     
     if hidden_mode:
         # Start monitoring and minimize to tray
+        set_preview_visible(False)
         start_monitoring()
         minimize_to_tray()
     
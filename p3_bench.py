@@ -0,0 +1,496 @@
+"""Benchmarks and regression gates for the face monitor in p3.py.
+
+Run from the directory holding p3.py, e.g. ``python p3_bench.py --bench-alloc``.
+The gates (--bench-alloc, --bench-journal, --bench-startup) exit non-zero on
+a regression so they can fail a build.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tkinter as tk
+import uuid
+
+from p3 import (CaffeSSDDetector, DetectionServer, FramePipeline, JournalSync, MonitorThread, MotionGate,
+                MultiSourceMonitor, PresenceJournal, PreviewRenderer, StartupPrefetch, SyntheticSource,
+                configure_logging, create_gui, cv2, load_settings, monitor_options, np, postprocess_ssd,
+                sign_token)
+
+
+# -------------------- Frame Pipeline --------------------
+def _legacy_frame_work(frame, preview_size):
+    """Per-frame image work as done before FramePipeline, kept as the benchmark baseline."""
+    cv2.resize(frame, (preview_size, preview_size))
+    cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def benchmark_allocations(frames=300, preview_size=300, width=640, height=480, threshold=4.0):
+    """Measure steady-state bytes allocated per frame with tracemalloc and process RSS.
+
+    Runs the old per-frame image work and the FramePipeline path (downscale,
+    reusable SSD blob, grayscale, motion gate, preview) over synthetic frames.
+    Returns False when the pipeline allocates more than threshold KiB per
+    frame, so the check can gate a build.
+    """
+    import tracemalloc
+
+    rng = np.random.default_rng(0)
+    source = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    ssd = CaffeSSDDetector()
+    pipeline = FramePipeline()
+    gate = MotionGate()
+    preview = np.empty((preview_size, preview_size, 3), dtype=np.uint8)
+
+    def pipeline_work(frame):
+        small = pipeline.process(frame, ssd.input_size(width, height))
+        ssd.fill_blob(small)
+        gate.should_detect(pipeline.grayscale(), 0.0)
+        cv2.resize(small, (preview_size, preview_size), dst=preview)
+
+    per_frame = {}
+    for name, work in (("legacy", lambda f: _legacy_frame_work(f, preview_size)), ("pipeline", pipeline_work)):
+        for _ in range(10):  # Warm up buffers and OpenCV internals
+            work(source)
+        rss_before = _rss_bytes()
+        tracemalloc.start()
+        peak_total = 0
+        for _ in range(frames):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            work(source)
+            peak_total += tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        rss_growth = _rss_bytes() - rss_before
+        per_frame[name] = peak_total / frames / 1024
+        print(f"{name:>8}: {per_frame[name]:9.1f} KiB allocated/frame, "
+              f"RSS growth {rss_growth / 1024:.0f} KiB over {frames} frames")
+    if per_frame["pipeline"] > threshold:
+        print(f"REGRESSION: pipeline exceeds the {threshold:g} KiB/frame threshold")
+        return False
+    print(f"OK: within the {threshold:g} KiB/frame threshold")
+    return True
+
+
+def _rss_bytes():
+    """Current resident set size, or 0 where it cannot be read cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return 0
+
+
+def benchmark_preview(frames=300, preview_size=300, width=640, height=480):
+    """Compare the preview's per-frame cost on the detection loop: inline as before, visible, and hidden."""
+    source = SyntheticSource(frames, width, height)
+    pipeline = FramePipeline()
+    preview = np.empty((preview_size, preview_size, 3), dtype=np.uint8)
+    faces = [(width // 4, height // 4, width // 5, height // 3)]
+    try:
+        cv2.imshow(PreviewRenderer.window, np.zeros((8, 8, 3), dtype=np.uint8))
+        cv2.waitKey(1)
+        cv2.destroyWindow(PreviewRenderer.window)
+        display = True
+    except Exception:
+        display = False
+
+    def inline(frame):
+        cv2.resize(pipeline.small, (preview_size, preview_size), dst=preview)
+        for (x, y, w, h) in faces:
+            cv2.rectangle(preview, (int(x * preview_size / frame.shape[1]), int(y * preview_size / frame.shape[0])),
+                          (int((x + w) * preview_size / frame.shape[1]), int((y + h) * preview_size / frame.shape[0])),
+                          (0, 255, 0), 2)
+        if display:
+            cv2.imshow(PreviewRenderer.window, preview)
+            cv2.setWindowProperty(PreviewRenderer.window, cv2.WND_PROP_TOPMOST, 1)
+            cv2.waitKey(1)
+
+    print(f"{'mode':>8} {'loop us/frame':>14} {'renders':>8} {'render us':>10} {'total cpu s':>12}")
+    for mode in ("inline", "visible", "hidden"):
+        renderer = None
+        if mode != "inline":
+            renderer = PreviewRenderer(preview_size, max_fps=10.0, visible=mode == "visible", display=display)
+            renderer.start()
+        source.open()
+        frame = None
+        loop_time = 0.0
+        cpu_start = time.process_time()
+        while True:
+            ok, frame = source.read(frame)
+            if not ok:
+                break
+            small = pipeline.process(frame, (300, 300))
+            start = time.perf_counter()
+            if renderer is None:
+                inline(frame)
+            else:
+                renderer.publish(small, faces, pipeline.scale)
+            loop_time += time.perf_counter() - start
+            time.sleep(1 / 30)
+        cpu = time.process_time() - cpu_start
+        rendered, render_us = frames, 0.0
+        if renderer is not None:
+            renderer.stop()
+            renderer.join()
+            rendered = renderer.rendered
+            render_us = renderer.render_time / max(renderer.rendered, 1) * 1e6
+        print(f"{mode:>8} {loop_time / frames * 1e6:14.1f} {rendered:8d} {render_us:10.1f} {cpu:12.3f}")
+    if display:
+        cv2.destroyAllWindows()
+    else:
+        print("(no display available: window calls were skipped)")
+
+
+# -------------------- SSD Post-processing --------------------
+def _postprocess_ssd_loop(detections, w, h, confidence=0.5):
+    """Original per-row post-processing, kept as the benchmark baseline."""
+    faces = []
+    for i in range(0, detections.shape[2]):
+        if detections[0, 0, i, 2] > confidence:
+            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+            (x, y, x2, y2) = box.astype("int")
+            x, y = max(0, x), max(0, y)
+            x2, y2 = min(w, x2), min(h, y2)
+            faces.append((x, y, x2 - x, y2 - y))
+    return faces
+
+
+def synthetic_ssd_detections(faces=1, rows=200, seed=0):
+    """Build an SSD-shaped output with a few confident, overlapping hits per face."""
+    rng = np.random.default_rng(seed)
+    detections = np.zeros((1, 1, rows, 7), dtype=np.float32)
+    detections[0, 0, :, 1] = 1
+    detections[0, 0, :, 2] = rng.uniform(0.0, 0.2, rows)
+    boxes = np.sort(rng.uniform(0.0, 1.0, (rows, 2, 2)), axis=1).reshape(rows, 4)
+    detections[0, 0, :, 3:7] = boxes[:, [0, 2, 1, 3]]
+    for i in range(faces):
+        x, y = 0.05 + 0.3 * (i % 3), 0.1 + 0.5 * (i // 3)
+        for j in range(3):
+            jitter = rng.uniform(-0.01, 0.01, 4)
+            detections[0, 0, i * 3 + j, 2] = rng.uniform(0.7, 0.99)
+            detections[0, 0, i * 3 + j, 3:7] = np.array([x, y, x + 0.25, y + 0.35]) + jitter
+    return detections
+
+
+def benchmark_postprocess(paths=None, repeat=2000, width=640, height=480):
+    """Compare the vectorized SSD post-processing against the original loop.
+
+    paths are .npy files of net.forward() output, as written by
+    --benchmark --dump-detections; synthetic tensors are used when none are
+    given.
+    """
+    tensors = [np.load(path) for path in paths] if paths else \
+        [synthetic_ssd_detections(faces) for faces in (0, 1, 2)]
+    for name, fn in (("loop", _postprocess_ssd_loop), ("vectorized", postprocess_ssd)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for detections in tensors:
+                fn(detections, width, height)
+        elapsed = time.perf_counter() - start
+        per_call = elapsed / (repeat * len(tensors)) * 1e6
+        print(f"{name:>10}: {per_call:8.1f} us/frame")
+    for detections in tensors:
+        print(f"faces: loop={len(_postprocess_ssd_loop(detections, width, height))} "
+              f"vectorized={len(postprocess_ssd(detections, width, height))}")
+
+
+# -------------------- Presence Journal --------------------
+def benchmark_journal(rate=50.0, duration=10.0, failure_rate=0.3):
+    """Push events at rate/s through a temporary journal to a flaky local stand-in server.
+
+    The stand-in rejects failure_rate of the uploads and stores batches by
+    id, so the run checks that every event arrives exactly once.
+    """
+    import tempfile
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    received = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if random.random() < failure_rate:
+                self.send_error(503)
+                return
+            received.setdefault(body["batchId"], [event["id"] for event in body["events"]])
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = os.path.join(tempfile.mkdtemp(), "journal.db")
+    journal = PresenceJournal(path).start()
+    sync = JournalSync(path, f"http://127.0.0.1:{server.server_address[1]}/", batch_size=200, interval=0.2,
+                       max_backoff=1.0)
+    sync.start()
+
+    states = ("one_face", "no_face", "multiple_faces", "locked")
+    sent = 0
+    record_time = 0.0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        t = time.perf_counter()
+        journal.record("bench", states[sent % len(states)], sent % 3)
+        record_time += time.perf_counter() - t
+        sent += 1
+        time.sleep(max(0.0, start + sent / rate - time.perf_counter()))
+    journal.stop()
+    deadline = time.monotonic() + 30.0
+    while sync.uploaded < journal.written and time.monotonic() < deadline:
+        time.sleep(0.1)
+    sync.stop()
+    sync.join()
+    server.shutdown()
+
+    ids = [i for batch in received.values() for i in batch]
+    print(f"events: {sent} recorded, {journal.written} journaled, {journal.dropped} dropped")
+    print(f"record(): {record_time / max(sent, 1) * 1e6:.1f} us per event on the caller")
+    print(f"uploads: {len(received)} batches, {sync.failures} failed attempts retried")
+    print(f"delivered: {len(set(ids))} unique events, {len(ids) - len(set(ids))} duplicates, "
+          f"{'complete' if len(set(ids)) == journal.written else 'INCOMPLETE'}")
+    return len(set(ids)) == journal.written == sent
+
+
+# -------------------- Multi-Source Monitor --------------------
+def benchmark_multi_source(max_sources=8, frames=200, detector=None):
+    """Measure per-source latency and aggregate throughput for 1..max_sources synthetic sources,
+    with and without batched inference."""
+    settings = load_settings()
+    if detector:
+        settings["detector"] = detector
+    options = dict(monitor_options(settings), motion_gate=False, tracking=False)
+    print(f"{'sources':>7} {'mode':>10} {'agg fps':>9} {'p50 ms':>8} {'p95 ms':>8} {'cpu %':>6}")
+    for n in range(1, max_sources + 1):
+        for batch in (False, True):
+            sources = [SyntheticSource(frames, seed=i) for i in range(n)]
+            monitor = MultiSourceMonitor(sources, batch=batch, **options)
+            latencies, wall, cpu = monitor.replay()
+            p50, p95 = np.percentile(np.array(latencies) * 1000, (50, 95)).tolist()
+            mode = "batched" if batch else "sequential"
+            print(f"{n:>7} {mode:>10} {n * len(latencies) / wall:9.1f} {p50:8.2f} {p95:8.2f} "
+                  f"{100 * cpu / wall:6.0f}")
+
+
+# -------------------- Detection Server --------------------
+def benchmark_server(max_sessions=32, fps=5.0, duration=5.0, budget_ms=250.0, detector=None):
+    """Load-test the detection server with stand-in clients on localhost.
+
+    Each client starts a session and posts synthetic JPEG frames at fps.
+    A session count is sustained when clients keep 90% of their frame rate
+    and p95 request latency stays within budget_ms. The clients run in
+    this process, so the result is a conservative sessions-per-core figure.
+    """
+    import http.client
+    settings = load_settings()
+    if detector:
+        settings["detector"] = detector
+    source = SyntheticSource(30)
+    source.open()
+    frames = []
+    while True:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+
+    server = DetectionServer.from_settings(settings, port=0)
+    server.jwt_secret = uuid.uuid4().hex
+    server.start()
+    auth = {"Authorization": "Bearer " + sign_token({"sub": "bench", "role": "student"}, server.jwt_secret)}
+
+    def client(latencies, sent, stop_at):
+        conn = http.client.HTTPConnection("127.0.0.1", server.port)
+        conn.request("POST", "/video/start-monitoring", json.dumps({}),
+                     dict(auth, **{"Content-Type": "application/json"}))
+        session_id = json.loads(conn.getresponse().read())["sessionId"]
+        next_at = time.monotonic()
+        i = 0
+        while time.monotonic() < stop_at:
+            t = time.perf_counter()
+            conn.request("POST", f"/video/frame/{session_id}", frames[i % len(frames)],
+                         dict(auth, **{"Content-Type": "image/jpeg"}))
+            conn.getresponse().read()
+            latencies.append(time.perf_counter() - t)
+            sent.append(1)
+            i += 1
+            next_at += 1.0 / fps
+            time.sleep(max(0.0, next_at - time.monotonic()))
+        conn.request("POST", "/video/stop-monitoring", json.dumps({"sessionId": session_id}),
+                     dict(auth, **{"Content-Type": "application/json"}))
+        conn.getresponse().read()
+        conn.close()
+
+    cores = os.cpu_count() or 1
+    sustained = 0
+    print(f"{'sessions':>8} {'fps/session':>11} {'p50 ms':>8} {'p95 ms':>8} {'avg batch':>9}")
+    n = 1
+    try:
+        while n <= max_sessions:
+            latencies, sent = [], []
+            batches_before = server.metrics.counters.get("batches", 0)
+            batched_before = server.metrics.counters.get("batched_frames", 0)
+            stop_at = time.monotonic() + duration
+            clients = [threading.Thread(target=client, args=(latencies, sent, stop_at)) for _ in range(n)]
+            for c in clients:
+                c.start()
+            for c in clients:
+                c.join()
+            achieved = len(sent) / n / duration
+            p50, p95 = np.percentile(np.array(latencies) * 1000, (50, 95)).tolist()
+            batches = server.metrics.counters.get("batches", 0) - batches_before
+            batched = server.metrics.counters.get("batched_frames", 0) - batched_before
+            print(f"{n:>8} {achieved:11.1f} {p50:8.1f} {p95:8.1f} {batched / max(batches, 1):9.1f}")
+            if achieved < 0.9 * fps or p95 > budget_ms:
+                break
+            sustained = n
+            n *= 2
+    finally:
+        server.stop()
+    print(f"Sustained {sustained} sessions at {fps:g} fps on {cores} cores "
+          f"({sustained / cores:.2f} sessions per core, {server.detector.name}).")
+    return sustained / cores
+
+
+# -------------------- Startup --------------------
+def startup_probe(source_spec=None, detector=None):
+    """Run the --hidden startup sequence up to the first presence decision and print its timestamps.
+
+    Used by benchmark_startup() in a fresh interpreter. The GUI is built
+    (withdrawn) when a display is available; the tray icon is not shown.
+    """
+    settings = load_settings()
+    if source_spec:
+        settings["sources"] = [source_spec]
+    if detector:
+        settings["detector"] = detector
+    timings = {}
+    prefetch = StartupPrefetch(settings).start()
+    try:
+        gui = create_gui()
+        gui.withdraw()
+        gui.update()
+    except tk.TclError:
+        gui = None  # No display
+    timings["gui_ready_at"] = time.time()
+    probe = MonitorThread(source=prefetch.take_source(), **monitor_options(settings))
+    probe.start()
+    deadline = time.monotonic() + 60.0
+    while not probe.metrics.counters.get("frames_processed") and probe.is_alive() and time.monotonic() < deadline:
+        if gui is not None:
+            gui.update()
+        time.sleep(0.005)
+    timings["first_decision_at"] = time.time() if probe.metrics.counters.get("frames_processed") else None
+    timings["gui"] = gui is not None
+    timings["detector"] = probe.detector.name if probe.detector else None
+    print("STARTUP " + json.dumps(timings), flush=True)
+    probe.stop()
+    probe.join(timeout=5.0)
+
+
+def benchmark_startup(runs=5, threshold=3.0, source_spec=None, detector=None):
+    """Measure time-to-first-decision of the --hidden path in fresh interpreters.
+
+    Returns False when the median exceeds threshold seconds, so the check can
+    gate a build. Eager import time of the heavy modules is shown for reference.
+    """
+    script = os.path.abspath(__file__)
+    probe = [sys.executable, script, "--startup-probe"]
+    if source_spec:
+        probe += ["--source", source_spec]
+    if detector:
+        probe += ["--detector", detector]
+
+    start = time.time()
+    subprocess.run([sys.executable, "-c", "import cv2, numpy"], capture_output=True)
+    eager_imports = time.time() - start
+
+    results = []
+    for run in range(runs):
+        start = time.time()
+        proc = subprocess.run(probe, capture_output=True, text=True, timeout=120)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("STARTUP ")]
+        if not lines or json.loads(lines[-1][8:])["first_decision_at"] is None:
+            print(f"run {run + 1}: no decision reached\n{proc.stderr[-2000:]}")
+            return False
+        timings = json.loads(lines[-1][8:])
+        results.append((timings["first_decision_at"] - start, timings["gui_ready_at"] - start))
+        print(f"run {run + 1}: first decision {results[-1][0]:.2f}s, GUI ready {results[-1][1]:.2f}s "
+              f"({timings['detector']}, {'GUI' if timings['gui'] else 'no display'})")
+
+    median = statistics.median(r[0] for r in results)
+    print(f"time to first decision: median {median:.2f}s, max {max(r[0] for r in results):.2f}s "
+          f"(eager cv2+numpy import alone: {eager_imports:.2f}s)")
+    if median > threshold:
+        print(f"REGRESSION: median exceeds the {threshold:.2f}s threshold")
+        return False
+    print(f"OK: within the {threshold:.2f}s threshold")
+    return True
+
+
+# -------------------- Entry Point --------------------
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Face Monitor benchmarks")
+    parser.add_argument("--bench-postprocess", nargs="*", metavar="NPY",
+                        help="benchmark SSD post-processing on detection tensors saved by p3.py --dump-detections "
+                             "(synthetic ones when no file is given)")
+    parser.add_argument("--bench-alloc", action="store_true",
+                        help="measure per-frame allocations of the frame pipeline; "
+                             "exit non-zero above --alloc-threshold")
+    parser.add_argument("--alloc-threshold", type=float, default=4.0,
+                        help="regression threshold in KiB/frame for --bench-alloc (default: 4)")
+    parser.add_argument("--bench-server", type=int, nargs="?", const=32, metavar="N",
+                        help="load-test the detection server with up to N stand-in clients")
+    parser.add_argument("--bench-preview", action="store_true",
+                        help="measure the preview's per-frame cost inline, visible and hidden")
+    parser.add_argument("--bench-journal", action="store_true",
+                        help="push events through the presence journal to a flaky local stand-in server")
+    parser.add_argument("--bench-startup", type=int, nargs="?", const=5, metavar="RUNS",
+                        help="measure --hidden time to first decision in fresh processes; "
+                             "exit non-zero above --startup-threshold")
+    parser.add_argument("--startup-threshold", type=float, default=3.0,
+                        help="regression threshold in seconds for --bench-startup (default: 3.0)")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--bench-multi", type=int, nargs="?", const=8, metavar="N",
+                        help="measure batched multi-source scaling from 1 to N synthetic sources")
+    parser.add_argument("--source", help="frame source for --bench-startup (default: from settings)")
+    parser.add_argument("--detector", help="detector backend (default: from settings)")
+    parser.add_argument("--frames", type=int, help="frames per run of --bench-alloc, --bench-preview and --bench-multi")
+    parser.add_argument("--fps", type=float, help="frame rate of --bench-server clients or --bench-journal events")
+    args = parser.parse_args()
+    configure_logging(load_settings())
+
+    ok = True
+    if args.bench_postprocess is not None:
+        benchmark_postprocess(args.bench_postprocess)
+    elif args.bench_alloc:
+        ok = benchmark_allocations(args.frames or 300, threshold=args.alloc_threshold)
+    elif args.bench_server:
+        benchmark_server(args.bench_server, args.fps or 5.0, detector=args.detector)
+    elif args.bench_multi:
+        benchmark_multi_source(args.bench_multi, args.frames or 200, args.detector)
+    elif args.bench_preview:
+        benchmark_preview(args.frames or 300)
+    elif args.bench_journal:
+        ok = benchmark_journal(args.fps or 50.0)
+    elif args.startup_probe:
+        startup_probe(args.source, args.detector)
+    elif args.bench_startup:
+        ok = benchmark_startup(args.bench_startup, args.startup_threshold, args.source, args.detector)
+    else:
+        parser.print_help()
+    sys.exit(0 if ok else 1)
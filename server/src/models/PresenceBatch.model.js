@@ -0,0 +1,43 @@
+import mongoose from "mongoose";
+
+const presenceEventSchema = new mongoose.Schema(
+  {
+    id: Number,
+    time: Number,
+    sessionId: String,
+    state: {
+      type: String,
+      enum: ["one_face", "multiple_faces", "different_person", "no_face", "locked"],
+    },
+    faces: Number,
+    courseId: String,
+    lessonId: String,
+    userId: String,
+    source: String,
+  },
+  { _id: false }
+);
+
+const presenceBatchSchema = new mongoose.Schema(
+  {
+    batchId: {
+      type: String,
+      required: true,
+      unique: true,
+    },
+    user: {
+      type: mongoose.Schema.Types.ObjectId,
+      ref: "User",
+    },
+    eventCount: {
+      type: Number,
+      default: 0,
+    },
+    events: [presenceEventSchema],
+  },
+  { timestamps: true }
+);
+
+presenceBatchSchema.index({ "events.courseId": 1 });
+
+export default mongoose.model("PresenceBatch", presenceBatchSchema);
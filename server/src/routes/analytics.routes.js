@@ -1,5 +1,6 @@
 import { Router } from "express";
 import Course from "../models/Course.model.js";
+import PresenceBatch from "../models/PresenceBatch.model.js";
 import { requireAuth, requireRole } from "../middleware/auth.js";
 
 const router = Router();
@@ -186,4 +187,81 @@ router.get("/instructor/dashboard", requireAuth, requireRole("teacher", "admin")
   }
 });
 
+// Receive a batch of presence events from the face monitor; batches are idempotent by batchId
+router.post("/presence/batch", requireAuth, async (req, res) => {
+  try {
+    const { batchId, events } = req.body;
+    if (!batchId || !Array.isArray(events)) {
+      return res.status(400).json({ message: "batchId and events are required" });
+    }
+
+    // Events are attributed to the authenticated user, whatever the client sent
+    const ownEvents = events.map(event => ({ ...event, userId: req.user.id }));
+    const result = await PresenceBatch.updateOne(
+      { batchId },
+      { $setOnInsert: { batchId, user: req.user.id, eventCount: ownEvents.length, events: ownEvents } },
+      { upsert: true, runValidators: true }
+    );
+
+    res.json({ batchId, accepted: ownEvents.length, duplicate: result.upsertedCount === 0 });
+  } catch (error) {
+    if (error.name === "ValidationError" || error.name === "CastError") {
+      return res.status(400).json({ message: error.message });
+    }
+    console.error("Error storing presence batch:", error);
+    res.status(500).json({ message: "Server error" });
+  }
+});
+
+// Get presence monitoring summary for a course (instructor or admin only)
+router.get("/course/:courseId/presence", requireAuth, requireRole("teacher", "admin"), async (req, res) => {
+  try {
+    const course = await Course.findById(req.params.courseId);
+
+    if (!course) {
+      return res.status(404).json({ message: "Course not found" });
+    }
+
+    if (course.instructor.toString() !== req.user.id && req.user.role !== "admin") {
+      return res.status(403).json({ message: "Not authorized to view these analytics" });
+    }
+
+    const courseId = course._id.toString();
+    const rows = await PresenceBatch.aggregate([
+      { $match: { "events.courseId": courseId } },
+      { $unwind: "$events" },
+      { $match: { "events.courseId": courseId } },
+      {
+        $group: {
+          _id: "$events.state",
+          count: { $sum: 1 },
+          sessions: { $addToSet: "$events.sessionId" },
+          lastEventAt: { $max: "$events.time" },
+        },
+      },
+    ]);
+
+    const states = {};
+    const sessions = new Set();
+    let lastEventAt = null;
+    rows.forEach(row => {
+      states[row._id] = row.count;
+      row.sessions.forEach(session => sessions.add(session));
+      lastEventAt = Math.max(lastEventAt || 0, row.lastEventAt);
+    });
+
+    res.json({
+      presence: {
+        courseId,
+        states,
+        sessions: sessions.size,
+        lastEventAt: lastEventAt ? new Date(lastEventAt * 1000).toISOString() : null
+      }
+    });
+  } catch (error) {
+    console.error("Error fetching presence analytics:", error);
+    res.status(500).json({ message: "Server error" });
+  }
+});
+
 export default router;
@@ -0,0 +1,45 @@
+import numpy as np
+
+import p3
+
+
+def ssd_output(rows):
+    """(1, 1, N, 7) SSD tensor from (confidence, x1, y1, x2, y2) rows in relative coordinates."""
+    detections = np.zeros((1, 1, len(rows), 7), dtype=np.float32)
+    for i, (confidence, *box) in enumerate(rows):
+        detections[0, 0, i, 1:] = (1, confidence, *box)
+    return detections
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 100, 100], [5, 5, 105, 105], [200, 200, 260, 260]], dtype=np.int32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert p3.non_max_suppression(boxes, scores, 0.3).tolist() == [1, 2]
+
+
+def test_nms_keeps_boxes_below_the_overlap_threshold():
+    boxes = np.array([[0, 0, 100, 100], [60, 0, 160, 100]], dtype=np.int32)  # IoU 0.25
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+    assert p3.non_max_suppression(boxes, scores, 0.3).tolist() == [0, 1]
+    assert p3.non_max_suppression(boxes, scores, 0.2).tolist() == [0]
+
+
+def test_postprocess_ssd_merges_duplicate_hits_and_clips():
+    detections = ssd_output([
+        (0.95, 0.10, 0.10, 0.40, 0.50),
+        (0.90, 0.11, 0.11, 0.41, 0.51),  # Same face, slightly shifted
+        (0.85, 0.80, 0.60, 1.20, 1.10),  # Runs off the frame
+        (0.30, 0.50, 0.50, 0.60, 0.60),  # Below the confidence threshold
+    ])
+    faces = p3.postprocess_ssd(detections, 640, 480, confidence=0.5, nms_threshold=0.3)
+    assert faces == [(64, 48, 192, 192), (512, 288, 128, 192)]
+
+
+def test_postprocess_ssd_without_confident_rows():
+    assert p3.postprocess_ssd(ssd_output([(0.2, 0.1, 0.1, 0.3, 0.3)]), 640, 480) == []
+
+
+def test_fill_blob_matches_blob_from_image():
+    image = np.random.default_rng(0).integers(0, 256, (300, 300, 3), dtype=np.uint8)
+    expected = p3.cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+    np.testing.assert_allclose(p3.CaffeSSDDetector().fill_blob(image), expected)
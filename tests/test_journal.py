@@ -0,0 +1,60 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import p3
+
+
+@pytest.fixture
+def server():
+    """Local stand-in for the upload route: refuses the first batch with 400 and stores the rest."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if not received and not getattr(self.server, "refused", False):
+                self.server.refused = True
+                self.send_error(400)
+                return
+            received.append(body)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/", received
+    httpd.shutdown()
+
+
+def test_rejected_batch_does_not_hold_back_later_batches(tmp_path, server):
+    url, received = server
+    path = str(tmp_path / "journal.db")
+    journal = p3.PresenceJournal(path, flush_interval=0.05).start()
+    for i in range(10):
+        journal.record("s1", "one_face", 1, course="c1")
+    journal.stop()
+
+    sync = p3.JournalSync(path, url, batch_size=4, interval=0.05)
+    sync.start()
+    deadline = time.monotonic() + 10.0
+    while sync.uploaded + sync.rejected < 10 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    sync.stop()
+    sync.join()
+
+    assert sync.rejected == 4
+    assert sync.uploaded == 6
+    assert sync.failures == 0
+    assert [event["id"] for batch in received for event in batch["events"]] == list(range(5, 11))
+    conn = p3.PresenceJournal.connect(path)
+    statuses = conn.execute("SELECT status, rejected IS NOT NULL FROM batches ORDER BY first_id").fetchall()
+    conn.close()
+    assert statuses == [(400, 1), (200, 0), (200, 0)]
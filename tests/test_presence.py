@@ -0,0 +1,78 @@
+import pytest
+
+import p3
+
+
+def test_aggregator_ignores_a_single_outlier():
+    aggregator = p3.PresenceAggregator(window=5, enter_share=0.6, exit_share=0.4)
+    counts = [aggregator.update(t, n) for t, n in enumerate([1, 1, 1, 0, 1, 2, 1])]
+    assert counts == [1] * 7
+
+
+def test_aggregator_switches_once_the_new_count_dominates():
+    aggregator = p3.PresenceAggregator(window=5, enter_share=0.6, exit_share=0.4)
+    counts = [aggregator.update(t, n) for t, n in enumerate([1, 1, 1, 1, 1, 0, 0, 0, 0])]
+    assert counts[:6] == [1] * 6
+    assert counts[-1] == 0
+    assert aggregator.last_face == 4
+
+
+def test_aggregator_drops_samples_older_than_max_age():
+    aggregator = p3.PresenceAggregator(window=5, max_age=10.0)
+    for t in range(5):
+        aggregator.update(t, 1)
+    assert aggregator.update(100.0, 0) == 0
+
+
+def test_aggregator_keeps_a_full_window_at_the_slowest_check_rate():
+    window, interval = 5, 3.0
+    aggregator = p3.PresenceAggregator(window, max_age=p3.PresenceAggregator.max_age_for(window, interval))
+    for i in range(window):
+        aggregator.update(i * interval, 1)
+    assert aggregator.size == window
+
+
+def test_aggregator_weighs_samples_by_confidence():
+    aggregator = p3.PresenceAggregator(window=4, enter_share=0.6, exit_share=0.4)
+    aggregator.update(0, 1, confidence=0.2)
+    assert aggregator.update(1, 2, confidence=1.0) == 2
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(p3, "system_cpu_load", lambda: 0.0)
+    return p3.DetectionScheduler(1.0, min_interval=0.2, max_interval=3.0, high_load=0.85, stable_after=30.0,
+                                 settle=3.0)
+
+
+def one_face(now=0.0):
+    presence = p3.PresenceMonitor(timeout=20, sensitivity=5, enable_notifications=False, enable_sound=False)
+    presence.update(1, now)
+    return presence
+
+
+def test_scheduler_checks_fast_right_after_a_change(scheduler):
+    assert scheduler.next_interval(one_face(), 0.0, 1) == 0.2
+
+
+def test_scheduler_slows_down_for_a_steady_face(scheduler):
+    presence = one_face()
+    scheduler.next_interval(presence, 0.0, 1)
+    assert scheduler.next_interval(presence, 18.0, 1) == pytest.approx(2.0)
+    assert scheduler.next_interval(presence, 60.0, 1) == pytest.approx(3.0)
+
+
+def test_scheduler_samples_the_time_left_before_a_warning(scheduler):
+    presence = one_face()
+    presence.update(0, 10.0)
+    scheduler.next_interval(presence, 10.0, 0)
+    # Warning at 15 s: 1 s left is sampled at least four times
+    assert scheduler.next_interval(presence, 14.0, 0) == pytest.approx(0.25)
+
+
+def test_scheduler_backs_off_under_load(scheduler, monkeypatch):
+    presence = one_face()
+    scheduler.next_interval(presence, 0.0, 1)
+    monkeypatch.setattr(p3, "system_cpu_load", lambda: 0.95)
+    assert scheduler.next_interval(presence, 3.0, 1) > 1.0
+    assert scheduler.next_interval(presence, 60.0, 1) == pytest.approx(3.0)
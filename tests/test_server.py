@@ -0,0 +1,35 @@
+import base64
+import json
+import time
+
+import p3
+
+SECRET = "test-secret"
+
+
+def test_verify_token_accepts_its_own_tokens():
+    token = p3.sign_token({"sub": "u1", "role": "student"}, SECRET)
+    assert p3.verify_token(token, SECRET) == {"sub": "u1", "role": "student"}
+
+
+def test_verify_token_rejects_another_secret():
+    assert p3.verify_token(p3.sign_token({"sub": "u1"}, "other"), SECRET) is None
+
+
+def test_verify_token_rejects_expired_tokens():
+    assert p3.verify_token(p3.sign_token({"sub": "u1", "exp": time.time() - 1}, SECRET), SECRET) is None
+    assert p3.verify_token(p3.sign_token({"sub": "u1", "exp": time.time() + 60}, SECRET), SECRET)["sub"] == "u1"
+
+
+def test_verify_token_rejects_a_tampered_payload():
+    header, _, signature = p3.sign_token({"sub": "u1", "role": "student"}, SECRET).split(".")
+    body = base64.urlsafe_b64encode(json.dumps({"sub": "u1", "role": "admin"}).encode()).rstrip(b"=").decode()
+    assert p3.verify_token(".".join((header, body, signature)), SECRET) is None
+
+
+def test_verify_token_rejects_unsigned_and_malformed_tokens():
+    header = base64.urlsafe_b64encode(b'{"alg": "none"}').rstrip(b"=").decode()
+    body = base64.urlsafe_b64encode(b'{"sub": "u1"}').rstrip(b"=").decode()
+    assert p3.verify_token(f"{header}.{body}.", SECRET) is None
+    assert p3.verify_token("not-a-token", SECRET) is None
+    assert p3.verify_token(None, SECRET) is None
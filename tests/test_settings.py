@@ -0,0 +1,38 @@
+import p3
+
+
+def test_validate_settings_fills_in_defaults():
+    settings = p3.validate_settings({})
+    assert settings == p3.DEFAULT_SETTINGS
+
+
+def test_validate_settings_coerces_to_the_default_type():
+    settings = p3.validate_settings({"timeout": "30", "check_interval": 1, "motion_gate": 0})
+    assert settings["timeout"] == 30 and isinstance(settings["timeout"], int)
+    assert settings["check_interval"] == 1.0 and isinstance(settings["check_interval"], float)
+    assert settings["motion_gate"] is False
+
+
+def test_validate_settings_clamps_to_the_allowed_range():
+    settings = p3.validate_settings({"timeout": 1, "sensitivity": 1000, "smoothing_exit": -2})
+    assert settings["timeout"] == 5
+    assert settings["sensitivity"] == 30
+    assert settings["smoothing_exit"] == 0.0
+
+
+def test_validate_settings_replaces_invalid_values():
+    settings = p3.validate_settings({"timeout": "soon", "sources": "webcam:1"})
+    assert settings["timeout"] == p3.DEFAULT_SETTINGS["timeout"]
+    assert settings["sources"] == []
+
+
+def test_validate_settings_keeps_unknown_keys():
+    assert p3.validate_settings({"custom": "x"})["custom"] == "x"
+
+
+def test_validate_settings_requires_exit_below_enter():
+    settings = p3.validate_settings({"smoothing_enter": 0.5, "smoothing_exit": 0.7})
+    assert settings["smoothing_enter"] == p3.DEFAULT_SETTINGS["smoothing_enter"]
+    assert settings["smoothing_exit"] == p3.DEFAULT_SETTINGS["smoothing_exit"]
+    settings = p3.validate_settings({"smoothing_enter": 0.8, "smoothing_exit": 0.3})
+    assert (settings["smoothing_enter"], settings["smoothing_exit"]) == (0.8, 0.3)